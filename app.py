@@ -1,6 +1,6 @@
 import os
-import math
-from datetime import datetime
+import click
+from datetime import datetime, timedelta
 from flask import (
     Flask,
     abort,
@@ -8,6 +8,7 @@ from flask import (
     redirect,
     render_template,
     request,
+    stream_with_context,
     url_for,
     jsonify,
 )
@@ -18,106 +19,222 @@ from flask_login import (
     login_user,
     logout_user,
 )
-from werkzeug.security import generate_password_hash, check_password_hash
-from sqlalchemy import or_, and_
+from sqlalchemy.orm import joinedload
 
 # Import our models
-from models import db, User, Dish, Review
+from models import (
+    db,
+    User,
+    Dish,
+    DishTag,
+    Review,
+    Tag,
+    DEFAULT_WILSON_CONFIDENCE,
+    catalog_version,
+    dish_documents,
+    document_page,
+    rebuild_stats_rollups,
+    refresh_dish_documents,
+    sync_wilson_confidence,
+    upgrade_schema,
+)
+import exports
+import images
+import passwords
+import search as search_index
+import sqlite_profile
+from pagination import InvalidCursor, paginate, parse_limit
+from read_routing import REPLICA_BIND, ReadRouting
+from query_plans import (
+    dish_card_columns,
+    dish_cards,
+    dish_document_options,
+    dish_full_options,
+    review_row_options,
+)
+from response_cache import ResponseCache
+from fragment_cache import FragmentCache
+from cache import create_cache
+from user_cache import UserCache
+import stats as stats_queries
 
 # App Setup
 app = Flask(__name__)
 app.config["SECRET_KEY"] = os.getenv("FLASK_SECRET", "supersecretkey")
-_SIMPLE_CACHE = {}
 
 # Database Configuration
 basedir = os.path.abspath(os.path.dirname(__file__))
-app.config["SQLALCHEMY_DATABASE_URI"] = (
-    f'sqlite:///{os.path.join(basedir, "food_app.db")}'
+app.config["SQLALCHEMY_DATABASE_URI"] = os.getenv(
+    "DATABASE_URL", f'sqlite:///{os.path.join(basedir, "food_app.db")}'
 )
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
-# Initialize extensions
+# Confidence level for the "rating" sort; stored scores are recomputed in bulk
+# by prepare_database() (or `flask recompute-wilson`) when this changes
+app.config["WILSON_CONFIDENCE"] = float(
+    os.getenv("WILSON_CONFIDENCE", DEFAULT_WILSON_CONFIDENCE)
+)
+
+# Size bounds for the in-process API response cache
+app.config["API_CACHE_MAX_ENTRIES"] = 1024
+app.config["API_CACHE_MAX_BYTES"] = 32 * 1024 * 1024
+# ...and for rendered dish cards (see fragment_cache.py)
+app.config["FRAGMENT_CACHE_MAX_ENTRIES"] = 4096
+app.config["FRAGMENT_CACHE_MAX_BYTES"] = 16 * 1024 * 1024
+
+# Formats of the resized dish images, best first; JPEG is always added as
+# the fallback (see images.py). "avif,webp" is smaller but slow to encode
+images.configure(app)
+
+# General purpose cache: "memory" (per process) or "sqlite" (shared by all
+# worker processes on the host)
+app.config["CACHE_BACKEND"] = os.getenv("CACHE_BACKEND", "memory")
+app.config["CACHE_SQLITE_PATH"] = os.getenv(
+    "CACHE_SQLITE_PATH", os.path.join(basedir, "cache.db")
+)
+app.config["ADMIN_STATS_CACHE_TTL"] = 300  # seconds
+# Logged-in user snapshots; local writes invalidate them immediately
+app.config["USER_CACHE_TTL"] = 60  # seconds
+
+# Password policy (see passwords.py): the hash method every stored password
+# converges on, the cap on logins verified at once (0 = no cap, verify on the
+# request thread) and processes used to hash passwords during bulk user
+# imports (default: one per core)
+app.config["PASSWORD_HASH_METHOD"] = os.getenv(
+    "PASSWORD_HASH_METHOD", passwords.DEFAULT_HASH_METHOD
+)
+app.config["PASSWORD_VERIFY_THREADS"] = int(os.getenv("PASSWORD_VERIFY_THREADS", 0))
+app.config["PASSWORD_HASH_WORKERS"] = os.getenv("PASSWORD_HASH_WORKERS")
+
+# SQLite pragmas and connection pool size (see sqlite_profile.py); set
+# SQLITE_PRAGMAS, SQLITE_POOL_SIZE and SQLITE_MAX_OVERFLOW to override
+sqlite_profile.configure(app)
+
+# Read-only views query a replica: DATABASE_REPLICA_URL, or the SQLite file
+# opened read-only (see read_routing.py)
+app.config["DATABASE_REPLICA_URL"] = os.getenv("DATABASE_REPLICA_URL")
+
+# Initialize extensions (the replica bind must be registered before the
+# engines are created)
+read_routing = ReadRouting(db)
+read_routing.init_app(app)
 db.init_app(app)
+with app.app_context():
+    sqlite_profile.apply(db.engine, app.config["SQLITE_PRAGMAS"])
+    if REPLICA_BIND in db.engines:
+        sqlite_profile.apply(
+            db.engines[REPLICA_BIND],
+            sqlite_profile.read_only_pragmas(app.config["SQLITE_PRAGMAS"]),
+        )
+api_cache = ResponseCache()
+api_cache.init_app(app)
+fragment_cache = FragmentCache()
+fragment_cache.init_app(app)
+stats_cache = create_cache(app.config, "admin_stats", max_entries=256)
+user_cache = UserCache()
+user_cache.init_app(app)
 login_manager = LoginManager(app)
 login_manager.login_view = "login"
 
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return user_cache.load(user_id)
 
 
 # Helper Functions
-def search_dishes(query):
-    """Search dishes by name, description, or tags"""
-    if not query:
-        return Dish.query.all()
+def get_tag_facets():
+    """(tag, dish count) pairs for every tag in use, sorted by tag name"""
+    rows = (
+        db.session.query(Tag.name, db.func.count(DishTag.dish_id))
+        .join(DishTag, DishTag.tag_id == Tag.id)
+        .group_by(Tag.id)
+        .all()
+    )
+    return sorted(
+        ((name, int(count)) for name, count in rows), key=lambda r: r[0].lower()
+    )
 
-    # Split query into terms
-    terms = [term.strip().lower() for term in query.split(",") if term.strip()]
 
-    if not terms:
-        return Dish.query.all()
+def get_all_tags():
+    """Get all unique tags from all dishes"""
+    return [name for name, _ in get_tag_facets()]
 
-    # Build search conditions
-    search_conditions = []
 
-    for term in terms:
-        # Search in name, description, and tags
-        name_condition = Dish.name.ilike(f"%{term}%")
-        desc_condition = Dish.description.ilike(f"%{term}%")
-        tags_condition = Dish._tags.ilike(f"%{term}%")
+# Sort orders for dish listings: (sort keys, descending). Each ends in a
+# unique tiebreaker on id so keyset pagination is stable.
+DISH_SORTS = {
+    "name": ([db.func.lower(Dish.name), Dish.id], False),
+    # Wilson score lower bound rather than the simple average
+    "rating": ([Dish.wilson_score, Dish.id], True),
+    "newest": ([Dish.created_at, Dish.id], True),
+}
 
-        search_conditions.append(or_(name_condition, desc_condition, tags_condition))
 
-    # Combine all conditions with OR
-    if search_conditions:
-        final_condition = or_(*search_conditions)
-        return Dish.query.filter(final_condition).all()
+def listing_order(query, sort, score):
+    """
+    (keys, descending, scope) of a dish listing: an explicit sort, else
+    relevance for searches, else id. The scope ties cursors to the listing.
+    """
+    if sort in DISH_SORTS:
+        keys, descending = DISH_SORTS[sort]
+    elif score is not None:
+        keys, descending, sort = [score, Dish.id], False, "relevance"
+    else:
+        keys, descending, sort = [Dish.id], False, "id"
+    return keys, descending, [sort, query or ""]
+
 
-    return Dish.query.all()
+def dish_listing(query="", sort=None, options=(), columns=None):
+    """
+    Select statement and sort order for the dishes matching `query`.
+    Returns (stmt, keys, descending, scope) for pagination.paginate().
+    Searches without an explicit sort are ordered by relevance. The
+    statement selects Dish entities, or just `columns` if given.
+    """
+    stmt = db.select(*columns) if columns else db.select(Dish)
+    stmt, score = search_index.apply_search(stmt, query)
+    stmt = stmt.options(*options)
+    return (stmt, *listing_order(query, sort, score))
 
 
-def get_all_tags():
-    """Get all unique tags from all dishes"""
-    all_tags = set()
-    dishes = Dish.query.all()
+def paginated_dishes(query="", sort=None, args=None, options=(), columns=None):
+    """One page of dishes plus the cursor for the next page (400 if invalid)"""
+    args = request.args if args is None else args
+    stmt, keys, descending, scope = dish_listing(query, sort, options, columns)
+    try:
+        return paginate(
+            db.session,
+            stmt,
+            keys,
+            descending,
+            limit=parse_limit(args.get("limit")),
+            cursor=args.get("cursor"),
+            scope=scope,
+        )
+    except InvalidCursor:
+        abort(400)
 
-    for dish in dishes:
-        if dish.tags:
-            all_tags.update(dish.tags)
 
-    return sorted(all_tags, key=str.lower)
+def document_variant(view):
+    """Stored document variant for the API's view=full|card parameter"""
+    return "card" if view == "card" else "full"
 
 
-def calculate_wilson_score(dish):
+def page_response(dishes, next_cursor, endpoint, **params):
     """
-    Calculate Wilson score for a dish based on its reviews.
-    Treats ratings of 4-5 stars as "positive" and 1-3 stars as "negative"
-    This gives a more reliable ranking than simple averages.
+    JSON envelope for a page of dishes, with a link to the next page,
+    assembled from the dishes' stored documents
     """
-    if not dish.reviews or len(dish.reviews) == 0:
-        return 0
-
-    total_ratings = len(dish.reviews)
-    positive_ratings = sum(1 for review in dish.reviews if review.rating >= 4)
-
-    if total_ratings == 0:
-        return 0
-
-    # 95% confidence Wilson score calculation
-    z = 1.96  # 95% confidence
-    p = positive_ratings / total_ratings
-
-    denominator = 1 + (z * z) / total_ratings
-    numerator = (
-        p
-        + (z * z) / (2 * total_ratings)
-        - z * math.sqrt((p * (1 - p) + (z * z) / (4 * total_ratings)) / total_ratings)
+    next_url = None
+    if next_cursor:
+        next_url = url_for(endpoint, cursor=next_cursor, **params)
+    documents = dish_documents(dishes, document_variant(params.get("view")))
+    return app.response_class(
+        document_page(documents, next_cursor=next_cursor, next=next_url),
+        mimetype="application/json",
     )
 
-    return numerator / denominator
-
 
 # Routes
 @app.route("/")
@@ -126,9 +243,10 @@ def index():
 
 
 @app.route("/dishes", methods=["GET", "POST"])
+@read_routing.read_only
 @login_required
 def list_dishes():
-    all_tags = get_all_tags()
+    tag_facets = get_tag_facets()
 
     # Handle both POST and GET requests
     if request.method == "POST":
@@ -138,38 +256,37 @@ def list_dishes():
         query = request.args.get("search", "").strip()
         sort = request.args.get("sort", "name")
 
-    # Get filtered dishes
-    filtered_dishes = search_dishes(query) if query else Dish.query.all()
-
-    # Sort dishes
-    if sort == "rating":
-        # NEW: Sort by Wilson score instead of simple average
-        filtered_dishes = sorted(
-            filtered_dishes, key=lambda d: calculate_wilson_score(d), reverse=True
-        )
-    elif sort == "name":
-        filtered_dishes = sorted(filtered_dishes, key=lambda d: d.name.lower())
-    elif sort == "newest":
-        filtered_dishes = sorted(
-            filtered_dishes, key=lambda d: d.created_at, reverse=True
-        )
+    # Get one page of filtered dishes, sorted in SQL, as card rows
+    rows, next_cursor = paginated_dishes(query, sort, columns=dish_card_columns())
+    filtered_dishes = dish_cards(rows)
 
     return render_template(
         "dishes.html",
         dishes=filtered_dishes,
-        tags=all_tags,
+        tag_facets=tag_facets,
         current_search=query,
         current_sort=sort,
+        next_cursor=next_cursor,
+        is_first_page=not request.args.get("cursor"),
     )
 
 
 @app.route("/dish/<int:dish_id>")
+@read_routing.read_only
 @login_required
 def dish_detail(dish_id):
     dish = Dish.query.get_or_404(dish_id)
-    # Sort reviews by date (newest first)
-    reviews = sorted(dish.reviews, key=lambda r: r.created_at, reverse=True)
-    return render_template("dish_detail.html", dish=dish, reviews=reviews)
+    # Reviews by date (newest first), with their authors in the same query
+    reviews = (
+        Review.query.filter_by(dish_id=dish_id)
+        .options(joinedload(Review.author))
+        .order_by(Review.created_at.desc())
+        .all()
+    )
+    user_review = next((r for r in reviews if r.user_id == current_user.id), None)
+    return render_template(
+        "dish_detail.html", dish=dish, reviews=reviews, user_review=user_review
+    )
 
 
 @app.route("/rate", methods=["POST"])
@@ -198,22 +315,27 @@ def rate_dish():
 
     if existing_review:
         # Update existing review
+        previous_rating = existing_review.rating
         existing_review.rating = rating
         existing_review.comment = comment
         existing_review.date = datetime.now().date()
+        review = existing_review
         flash("Your review has been updated.", "success")
     else:
         # Create new review
-        new_review = Review(
+        previous_rating = None
+        review = Review(
             dish_id=dish_id, user_id=current_user.id, rating=rating, comment=comment
         )
-        db.session.add(new_review)
+        db.session.add(review)
         flash("Review added successfully.", "success")
 
     try:
+        # Update the dish's rating aggregates in the same transaction (the
+        # dashboard rollups follow from the flush)
+        dish.record_rating(rating, previous_rating)
         db.session.commit()
-        # Update average rating
-        dish.update_avg_rating()
+        stats_cache.invalidate_tags("reviews")
     except Exception as e:
         db.session.rollback()
         flash("An error occurred while saving your review.", "danger")
@@ -243,11 +365,12 @@ def register():
         else:
             # Create new user
             user = User(
-                username=username, password_hash=generate_password_hash(password)
+                username=username, password_hash=passwords.hash_password(password)
             )
             try:
                 db.session.add(user)
                 db.session.commit()
+                stats_cache.invalidate_tags("users")
                 flash("Registration successful! Please log in.", "success")
                 return redirect(url_for("login"))
             except Exception as e:
@@ -269,7 +392,9 @@ def login():
 
         user = User.query.filter_by(username=username).first()
 
-        if user and check_password_hash(user.password_hash, password):
+        if user and passwords.check_and_upgrade(user, password):
+            # Persists a re-hash made to match the password policy
+            db.session.commit()
             login_user(user)
             flash(f"Welcome back, {username}!", "success")
             next_page = request.args.get("next")
@@ -292,33 +417,76 @@ def logout():
 
 
 # API Routes (for future mobile app or AJAX calls)
+def listing_version(**view_args):
+    """Cache version for responses that depend on the whole catalog"""
+    return catalog_version()
+
+
+def dish_version(dish_id):
+    """Cache version for a single dish (None if it doesn't exist)"""
+    return db.session.scalar(db.select(Dish.version).where(Dish.id == dish_id))
+
+
 @app.route("/api/dishes")
+@read_routing.read_only
 @login_required
+@api_cache.cached(listing_version)
 def api_dishes():
-    """API endpoint to get all dishes"""
-    dishes = Dish.query.all()
-    return jsonify([dish.to_dict() for dish in dishes])
+    """
+    API endpoint to get dishes, one page at a time
+
+    Query params: sort=name|rating|newest, limit=N, cursor=<next_cursor>,
+    view=full|card (card leaves out the reviews)
+    """
+    sort = request.args.get("sort")
+    limit = parse_limit(request.args.get("limit"))
+    view = request.args.get("view")
+    dishes, next_cursor = paginated_dishes(sort=sort, options=dish_document_options())
+    return page_response(
+        dishes, next_cursor, "api_dishes", sort=sort, limit=limit, view=view
+    )
 
 
 @app.route("/api/dishes/<int:dish_id>")
+@read_routing.read_only
 @login_required
+@api_cache.cached(dish_version)
 def api_dish_detail(dish_id):
     """API endpoint to get a specific dish"""
-    dish = Dish.query.get_or_404(dish_id)
-    return jsonify(dish.to_dict())
+    dish = (
+        Dish.query.filter_by(id=dish_id)
+        .options(*dish_document_options())
+        .first_or_404()
+    )
+    return app.response_class(
+        dish_documents([dish])[0] + "\n", mimetype="application/json"
+    )
 
 
 @app.route("/api/search")
+@read_routing.read_only
 @login_required
+@api_cache.cached(listing_version)
 def api_search():
-    """API endpoint for dish search"""
+    """
+    API endpoint for dish search, best matches first
+
+    Query params: q=terms, sort=name|rating|newest, limit=N, cursor=...,
+    view=full|card
+    """
     query = request.args.get("q", "")
-    dishes = search_dishes(query)
-    return jsonify([dish.to_dict() for dish in dishes])
+    sort = request.args.get("sort")
+    limit = parse_limit(request.args.get("limit"))
+    view = request.args.get("view")
+    dishes, next_cursor = paginated_dishes(query, sort, options=dish_document_options())
+    return page_response(
+        dishes, next_cursor, "api_search", q=query, sort=sort, limit=limit, view=view
+    )
 
 
 # Admin Routes (for development/debugging)
 @app.route("/admin/stats")
+@read_routing.read_only
 @login_required
 def admin_stats():
     """
@@ -329,7 +497,10 @@ def admin_stats():
       end=YYYY-MM-DD         optional end date (inclusive)
       min_reviews=N          minimum reviews for top/bottom lists (default 3)
       period=30              review trend window in days (default 30)
-      export=csv             if present and equals 'csv', returns a CSV export
+      granularity=day        review trend buckets: day, week or month
+      export=csv             if present and equals 'csv', streams a CSV export
+                             of the reviews in range
+      gzip=1                 with export=csv, gzip the export (.csv.gz)
     """
     # Keep your debug guard
     if not app.debug:
@@ -345,9 +516,6 @@ def admin_stats():
         except Exception:
             return default_date
 
-    def dt_from_date(d):
-        return datetime(d.year, d.month, d.day)
-
     def utcnow_date():
         return datetime.utcnow().date()
 
@@ -380,190 +548,126 @@ def admin_stats():
     except Exception:
         min_reviews = 3
 
-    export_csv = request.args.get("export", "").lower() == "csv"
+    granularity = request.args.get("granularity", "day").lower()
+    if granularity not in stats_queries.GRANULARITIES:
+        granularity = "day"
+
+    # CSV export: streamed straight from the database, no stats needed
+    if request.args.get("export", "").lower() == "csv":
+        return export_reviews_csv(
+            start_date, end_date, gzip=request.args.get("gzip") in ("1", "true")
+        )
 
     # cache key and simple caching
     cache_key = (
-        f"admin_stats:{start_date.isoformat()}:{end_date.isoformat()}:{min_reviews}"
+        f"admin_stats:{start_date.isoformat()}:{end_date.isoformat()}"
+        f":{min_reviews}:{granularity}"
     )
-    if cache_key in _SIMPLE_CACHE:
-        stats = _SIMPLE_CACHE[cache_key]
-    else:
-        # compute stats
+    stats = stats_cache.get(cache_key)
+    if stats is None:
+        # compute stats from the rollup tables and top-k index scans
         # Totals
-        total_users = User.query.count()
-        total_dishes = Dish.query.count()
-        total_reviews = Review.query.count()
-        avg_rating_row = db.session.query(db.func.avg(Review.rating)).scalar()
-        avg_rating = float(avg_rating_row) if avg_rating_row is not None else 0.0
+        totals = stats_queries.catalog_totals()
+        total_users = totals["users"]
+        total_dishes = totals["dishes"]
+        total_reviews = totals["reviews"]
+        avg_rating = totals["avg_rating"]
 
         # Most reviewed dish overall
-        most_reviewed_row = (
-            db.session.query(Dish, db.func.count(Review.id).label("rc"))
-            .join(Review)
-            .group_by(Dish.id)
-            .order_by(db.func.count(Review.id).desc())
+        most_reviewed_dish = (
+            Dish.query.options(*dish_full_options())
+            .filter(Dish.review_count > 0)
+            .order_by(Dish.review_count.desc())
             .first()
         )
-        if most_reviewed_row:
-            most_reviewed_dish, most_reviewed_count = most_reviewed_row[0], int(
-                most_reviewed_row[1]
-            )
-        else:
-            most_reviewed_dish, most_reviewed_count = None, 0
+        most_reviewed_count = (
+            most_reviewed_dish.review_count if most_reviewed_dish else 0
+        )
 
         # Top and bottom dishes by avg_rating, with at least min_reviews
-        dish_stats_rows = (
-            db.session.query(
-                Dish.id,
-                Dish.name,
-                Dish.avg_rating,
-                db.func.count(Review.id).label("review_count"),
+        def rated_dishes(*order_by):
+            rows = (
+                db.session.query(Dish.id, Dish.name, Dish.avg_rating, Dish.review_count)
+                .filter(Dish.review_count >= min_reviews)
+                .order_by(*order_by)
+                .limit(10)
+                .all()
             )
-            .outerjoin(Review)
-            .group_by(Dish.id)
-            .all()
-        )
+            return [
+                {
+                    "id": did,
+                    "name": name,
+                    "avg_rating": round(float(ar or 0.0), 2),
+                    "review_count": int(rc),
+                }
+                for did, name, ar, rc in rows
+            ]
 
-        # convert to plain tuples for sorting
-        dish_stats = []
-        for row in dish_stats_rows:
-            did, dname, davg, dcount = row[0], row[1], row[2], int(row[3] or 0)
-            davg_val = float(davg) if davg is not None else 0.0
-            dish_stats.append((did, dname, davg_val, dcount))
-
-        top_rated = []
-        bottom_rated = []
-        if dish_stats:
-            # top by avg desc, tie-breaker by review_count desc
-            dish_stats_sorted_top = sorted(
-                dish_stats, key=lambda x: (-x[2], -x[3], x[1])
-            )
-            for did, name, ar, rc in dish_stats_sorted_top:
-                if rc >= min_reviews:
-                    top_rated.append(
-                        {
-                            "id": did,
-                            "name": name,
-                            "avg_rating": round(ar, 2),
-                            "review_count": rc,
-                        }
-                    )
-                    if len(top_rated) >= 10:
-                        break
-
-            # bottom by avg asc, tie-breaker review_count desc
-            dish_stats_sorted_bottom = sorted(
-                dish_stats, key=lambda x: (x[2], -x[3], x[1])
-            )
-            for did, name, ar, rc in dish_stats_sorted_bottom:
-                if rc >= min_reviews:
-                    bottom_rated.append(
-                        {
-                            "id": did,
-                            "name": name,
-                            "avg_rating": round(ar, 2),
-                            "review_count": rc,
-                        }
-                    )
-                    if len(bottom_rated) >= 10:
-                        break
+        # top by avg desc, bottom by avg asc; ties by review_count desc
+        top_rated = rated_dishes(
+            Dish.avg_rating.desc(), Dish.review_count.desc(), Dish.name
+        )
+        bottom_rated = rated_dishes(
+            Dish.avg_rating.asc(), Dish.review_count.desc(), Dish.name
+        )
 
         # Newest dishes and latest reviews
-        newest_dishes = Dish.query.order_by(Dish.created_at.desc()).limit(5).all()
-        latest_reviews = Review.query.order_by(Review.created_at.desc()).limit(10).all()
+        newest_dishes = (
+            Dish.query.options(*dish_full_options())
+            .order_by(Dish.created_at.desc())
+            .limit(5)
+            .all()
+        )
+        latest_reviews = (
+            Review.query.options(*review_row_options())
+            .order_by(Review.created_at.desc())
+            .limit(10)
+            .all()
+        )
 
         # rating distribution overall
-        rating_distribution = {}
-        for s in range(1, 6):
-            rating_distribution[s] = Review.query.filter_by(rating=s).count()
-
-        # reviews per day in range
-        start_dt = dt_from_date(start_date)
-        end_dt = dt_from_date(end_date)
-        days = (end_dt - start_dt).days + 1
-        review_trend = []
-        for i in range(days):
-            day_dt = datetime.utcfromtimestamp(start_dt.timestamp() + i * 86400)
-            day_start = day_dt
-            day_end = datetime.utcfromtimestamp(day_start.timestamp() + 86400)
-            cnt = Review.query.filter(
-                Review.created_at >= day_start,
-                Review.created_at < day_end,
-            ).count()
-            review_trend.append({"date": day_start.date().isoformat(), "count": cnt})
-
-        # percent change vs previous same-length period
-        prev_start_ts = start_dt.timestamp() - days * 86400
-        prev_start_dt = datetime.utcfromtimestamp(prev_start_ts)
-        prev_end_dt = start_dt  # exclusive end is start_dt
-        prev_count = Review.query.filter(
-            Review.created_at >= prev_start_dt, Review.created_at < prev_end_dt
-        ).count()
-        cur_count = sum(r["count"] for r in review_trend)
-
-        def pct_change(prev, cur):
-            if prev == 0:
-                return None if cur == 0 else 100.0
-            return round((cur - prev) * 100.0 / prev, 2)
-
-        review_percent_change = pct_change(prev_count, cur_count)
-
-        # average and median-ish review length
-        comment_rows = Review.query.with_entities(Review.comment).all()
-        lengths = [len(r[0] or "") for r in comment_rows]
-        avg_review_length = (
-            round(float(sum(lengths)) / len(lengths), 2) if lengths else 0.0
+        rating_distribution = stats_queries.rating_distribution()
+
+        # reviews per day/week/month in range, and the change against the
+        # previous period of the same length, from one grouped query
+        review_trend, review_percent_change = stats_queries.review_trend(
+            start_date, end_date, granularity
         )
-        median_review_length = None
-        if lengths:
-            lengths.sort()
-            n = len(lengths)
-            if n % 2 == 1:
-                median_review_length = lengths[n // 2]
-            else:
-                median_review_length = (lengths[n // 2 - 1] + lengths[n // 2]) / 2
+
+        # review length average, median and percentiles, computed in SQL
+        review_lengths = stats_queries.review_length_stats()
 
         # top reviewers
-        top_reviewers_rows = (
+        top_reviewers = stats_queries.top_reviewers(10)
+
+        # tag usage counts and tag-level average dish rating
+        tag_rows = (
             db.session.query(
-                User.id, User.username, db.func.count(Review.id).label("rc")
+                Tag.name,
+                db.func.count(DishTag.dish_id).label("cnt"),
+                db.func.avg(db.func.coalesce(Dish.avg_rating, 0.0)),
             )
-            .join(Review)
-            .group_by(User.id)
-            .order_by(db.func.count(Review.id).desc())
-            .limit(10)
+            .join(DishTag, DishTag.tag_id == Tag.id)
+            .join(Dish, Dish.id == DishTag.dish_id)
+            .group_by(Tag.id)
+            .order_by(db.desc("cnt"), Tag.name)
+            .limit(20)
             .all()
         )
-        top_reviewers = [
-            {"id": row[0], "username": row[1], "review_count": int(row[2])}
-            for row in top_reviewers_rows
+        tag_summary = [
+            {
+                "tag": name,
+                "count": int(cnt),
+                "avg_rating": round(float(avg_t), 2) if avg_t is not None else None,
+            }
+            for name, cnt, avg_t in tag_rows
         ]
 
-        # tag usage counts and tag-level average dish rating (assumes Dish.tags is a list)
-        tag_counts = {}
-        tag_rating_acc = {}
-        for dish in Dish.query.all():
-            tags = dish.tags or []
-            for t in tags:
-                tag_counts[t] = tag_counts.get(t, 0) + 1
-                tag_rating_acc.setdefault(t, []).append(
-                    dish.avg_rating if dish.avg_rating is not None else 0.0
-                )
-        tag_summary = []
-        # sort tags by count desc
-        sorted_tags = sorted(tag_counts.items(), key=lambda kv: (-kv[1], kv[0]))[:20]
-        for t, cnt in sorted_tags:
-            ratings = tag_rating_acc.get(t, [])
-            avg_t = round(sum(ratings) / len(ratings), 2) if ratings else None
-            tag_summary.append({"tag": t, "count": cnt, "avg_rating": avg_t})
-
         # dish-level review counts and a sample review
         top_by_reviews_rows = (
-            db.session.query(Dish.id, Dish.name, db.func.count(Review.id).label("rc"))
-            .join(Review)
-            .group_by(Dish.id)
-            .order_by(db.func.count(Review.id).desc())
+            db.session.query(Dish.id, Dish.name, Dish.review_count)
+            .filter(Dish.review_count > 0)
+            .order_by(Dish.review_count.desc())
             .limit(10)
             .all()
         )
@@ -584,39 +688,8 @@ def admin_stats():
             )
 
         # monthly series for users and dishes (last 12 months)
-        def add_months(base_dt, months):
-            # months can be negative
-            y = base_dt.year + (base_dt.month - 1 + months) // 12
-            m = (base_dt.month - 1 + months) % 12 + 1
-            return datetime(y, m, 1)
-
-        def month_series_for(entity, months_back=12):
-            dialect_name = db.engine.dialect.name if hasattr(db, "engine") else "other"
-            if dialect_name == "sqlite":
-                period_col = db.func.strftime("%Y-%m", entity.created_at)
-            else:
-                # try to_char for postgres / others
-                period_col = db.func.to_char(entity.created_at, "YYYY-MM")
-            q = (
-                db.session.query(period_col.label("period"), db.func.count(entity.id))
-                .group_by("period")
-                .order_by("period")
-                .all()
-            )
-            qmap = {str(row[0])[:7]: int(row[1]) for row in q}
-
-            results = []
-            # create months ending at current month
-            now = datetime.utcnow()
-            last_month_start = datetime(now.year, now.month, 1)
-            for i in range(months_back - 1, -1, -1):
-                mdt = add_months(last_month_start, -i)
-                key = mdt.strftime("%Y-%m")
-                results.append({"month": key, "count": qmap.get(key, 0)})
-            return results
-
-        users_by_month = month_series_for(User, 12)
-        dishes_by_month = month_series_for(Dish, 12)
+        users_by_month = stats_queries.monthly_signups("users", 12)
+        dishes_by_month = stats_queries.monthly_signups("dishes", 12)
 
         # newest users
         newest_users = User.query.order_by(User.created_at.desc()).limit(5).all()
@@ -665,8 +738,13 @@ def admin_stats():
                 "distribution": rating_distribution,
                 "trend": review_trend,
                 "trend_percent_change_vs_previous_period": review_percent_change,
-                "avg_review_length": avg_review_length,
-                "median_review_length": median_review_length,
+                "avg_review_length": review_lengths["avg"],
+                "median_review_length": review_lengths["median"],
+                "review_length_percentiles": {
+                    key: value
+                    for key, value in review_lengths.items()
+                    if key.startswith("p")
+                },
             },
             "users": {
                 "top_reviewers": top_reviewers,
@@ -688,69 +766,54 @@ def admin_stats():
             },
         }
 
-        # cache it (simple in-process cache)
-        _SIMPLE_CACHE[cache_key] = stats
-        _SIMPLE_CACHE["last_cache_time"] = datetime.utcnow().isoformat()
-
-    # CSV export path
-    if export_csv:
-        # build CSV manually
-        rows = []
-        header = [
-            "review_id",
-            "dish_id",
-            "dish_name",
-            "user_id",
-            "username",
-            "rating",
-            "date",
-            "comment",
-        ]
-        rows.append(",".join(['"{}"'.format(h.replace('"', '""')) for h in header]))
-        # fetch reviews in range
-        range_start_dt = datetime(start_date.year, start_date.month, start_date.day)
-        range_end_dt = datetime(end_date.year, end_date.month, end_date.day, 23, 59, 59)
-        reviews_q = (
-            Review.query.filter(
-                Review.created_at >= range_start_dt, Review.created_at <= range_end_dt
-            )
-            .order_by(Review.created_at.asc())
-            .all()
+        # cache it until it expires or the underlying data changes
+        stats_cache.set(
+            cache_key,
+            stats,
+            ttl=app.config["ADMIN_STATS_CACHE_TTL"],
+            tags=("reviews", "users", "dishes"),
         )
-        for r in reviews_q:
-            dish_name = r.dish.name if r.dish else ""
-            username = r.author.username if r.author else ""
-            comment = (r.comment or "").replace("\n", " ").replace("\r", " ")
-
-            def esc(s):
-                s2 = str(s).replace('"', '""')
-                return f'"{s2}"'
-
-            row = [
-                esc(r.id),
-                esc(r.dish_id),
-                esc(dish_name),
-                esc(r.user_id),
-                esc(username),
-                esc(r.rating),
-                esc(
-                    (
-                        r.date.isoformat()
-                        if hasattr(r, "date") and r.date is not None
-                        else ""
-                    )
-                ),
-                esc(comment),
-            ]
-            rows.append(",".join(row))
-        csv_text = "\n".join(rows)
-        headers = {
-            "Content-Type": "text/csv",
-            "Content-Disposition": f'attachment; filename="reviews_{start_date.isoformat()}_{end_date.isoformat()}.csv"',
-        }
-        return (csv_text, 200, headers)
 
-    return jsonify(_SIMPLE_CACHE[cache_key])
+    return jsonify(stats)
+
+
+def export_reviews_csv(start_date, end_date, gzip=False):
+    """Stream the reviews created between two dates (inclusive) as CSV"""
+    start_dt = datetime(start_date.year, start_date.month, start_date.day)
+    end_dt = datetime(end_date.year, end_date.month, end_date.day) + timedelta(days=1)
+    chunks = exports.iter_csv(
+        exports.review_export_rows(start_dt, end_dt), exports.REVIEW_EXPORT_HEADER
+    )
+    filename = f"reviews_{start_date.isoformat()}_{end_date.isoformat()}.csv"
+    mimetype = "text/csv"
+    if gzip:
+        chunks = exports.gzip_chunks(chunks)
+        filename += ".gz"
+        mimetype = "application/gzip"
+
+    response = app.response_class(stream_with_context(chunks), mimetype=mimetype)
+    response.headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
+@app.route("/admin/metrics")
+@login_required
+def admin_metrics():
+    """Cache and password verification counters for the admin dashboard"""
+    if not app.debug:
+        abort(403)
+
+    return jsonify(
+        {
+            "caches": {
+                "admin_stats": stats_cache.stats(),
+                "api_responses": api_cache.entries.stats(),
+                "card_fragments": fragment_cache.entries.stats(),
+                "users": user_cache.entries.stats(),
+            },
+            "password_verification": passwords.verification_metrics.stats(),
+        }
+    )
 
 
 # Error Handlers
@@ -771,10 +834,17 @@ def forbidden_error(error):
 
 
 # Database initialization
+def prepare_database():
+    """Create missing tables and secondary indexes (must run in app context)"""
+    db.create_all()
+    upgrade_schema()
+    search_index.ensure_search_index()
+
+
 def init_db():
     """Initialize the database"""
     with app.app_context():
-        db.create_all()
+        prepare_database()
         print("Database initialized!")
 
 
@@ -788,7 +858,7 @@ def migrate_from_json():
         print(f"Created backup: {backup_dir}")
 
         # Create tables
-        db.create_all()
+        prepare_database()
 
         # Migrate data
         migrate_json_data()
@@ -808,10 +878,60 @@ def migrate_json():
     migrate_from_json()
 
 
+@app.cli.command()
+def rebuild_search_index():
+    """Rebuild the full-text search index."""
+    if search_index.ensure_search_index(rebuild=True):
+        print("Search index rebuilt.")
+    else:
+        print("Full-text search is only available on SQLite.")
+
+
+@app.cli.command()
+def recompute_wilson():
+    """Recompute stored Wilson scores for the configured confidence."""
+    if not sync_wilson_confidence():
+        print("Wilson scores are already up to date.")
+
+
+@app.cli.command()
+def rebuild_stats():
+    """Rebuild the admin dashboard rollup tables."""
+    rebuild_stats_rollups()
+    db.session.commit()
+    stats_cache.clear()
+    print("Dashboard rollups rebuilt.")
+
+
+@app.cli.command()
+def rebuild_dish_documents():
+    """Re-serialize the stored JSON documents of every dish."""
+    refresh_dish_documents()
+    db.session.commit()
+    print("Dish documents rebuilt.")
+
+
+@app.cli.command()
+@click.option("--force", is_flag=True, help="Re-encode unchanged images too.")
+def build_images(force):
+    """Build the resized WebP/JPEG variants of every dish image."""
+    if not images.available():
+        print("Building image variants needs Pillow (pip install Pillow).")
+        return
+    updated, deleted = images.build_all(force=force)
+    print(f"Built image variants for {updated} dishes, deleted {deleted} old files.")
+
+
+@app.cli.command()
+def database_profile():
+    """Show the SQLite pragmas and pool size in effect."""
+    print(sqlite_profile.report(db.engine, app.config["SQLITE_PRAGMAS"]))
+
+
 @app.cli.command()
 def create_sample_user():
     """Create a sample admin user."""
-    user = User(username="admin", password_hash=generate_password_hash("admin123"))
+    user = User(username="admin", password_hash=passwords.hash_password("admin123"))
     try:
         db.session.add(user)
         db.session.commit()
@@ -824,6 +944,7 @@ def create_sample_user():
 if __name__ == "__main__":
     # Initialize database on first run
     with app.app_context():
-        db.create_all()
+        prepare_database()
+        print(sqlite_profile.report(db.engine, app.config["SQLITE_PRAGMAS"]))
 
     app.run(debug=True)
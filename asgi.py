@@ -0,0 +1,360 @@
+import hashlib
+import re
+from urllib.parse import parse_qsl, quote, urlencode
+
+from itsdangerous import BadSignature
+from sqlalchemy import select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from werkzeug.http import parse_cookie
+
+import search as search_index
+import sqlite_profile
+from app import app, prepare_database, document_variant, listing_order
+from cache import Cache, MemoryBackend
+from models import (
+    db,
+    AppSetting,
+    CATALOG_VERSION_KEY,
+    Dish,
+    User,
+    dish_documents,
+    document_page,
+)
+from pagination import InvalidCursor, page_statement, parse_limit, split_page
+from query_plans import dish_document_options
+from read_routing import REPLICA_BIND, recently_wrote
+
+# ASGI serving mode for the read-only JSON API
+#
+#     uvicorn asgi:application --workers 4
+#
+# Serves /api/dishes, /api/dishes/<id> and /api/search as async handlers over
+# an async driver (aiosqlite for SQLite), so a request waiting on the
+# database doesn't hold a thread. Everything else stays on the Flask app.
+# The handlers reuse the models, loader options, search and pagination
+# helpers, accept the Flask session cookie for login, and produce the same
+# bodies, cache keys and ETags as the Flask views.
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+
+def async_database_url(url):
+    """The async-driver equivalent of a sync SQLAlchemy URL"""
+    url = make_url(url)
+    driver = ASYNC_DRIVERS.get(url.drivername)
+    return url.set(drivername=driver) if driver else url
+
+
+engine = create_async_engine(
+    app.config.get("ASYNC_DATABASE_URL")
+    or async_database_url(app.config["SQLALCHEMY_DATABASE_URI"]),
+    **sqlite_profile.pool_options(app.config),
+)
+sqlite_profile.apply(engine.sync_engine, app.config["SQLITE_PRAGMAS"])
+# All handlers are reads, so they use the replica bind when there is one
+# (see read_routing.py), except for users who have just written
+replica_url = app.config.get("ASYNC_DATABASE_REPLICA_URL") or app.config[
+    "SQLALCHEMY_BINDS"
+].get(REPLICA_BIND)
+if replica_url:
+    replica_engine = create_async_engine(
+        async_database_url(replica_url), **sqlite_profile.pool_options(app.config)
+    )
+    sqlite_profile.apply(
+        replica_engine.sync_engine,
+        sqlite_profile.read_only_pragmas(app.config["SQLITE_PRAGMAS"]),
+    )
+else:
+    replica_engine = engine
+async_session = async_sessionmaker(engine, expire_on_commit=False)
+
+# Same bounds as the Flask app's response cache; entries are per process
+responses = Cache(
+    MemoryBackend(
+        max_entries=app.config["API_CACHE_MAX_ENTRIES"],
+        max_bytes=app.config["API_CACHE_MAX_BYTES"],
+    ),
+    name="api",
+)
+# Ids of users known to exist, like the Flask app's user cache
+known_users = Cache(
+    MemoryBackend(max_entries=10000),
+    default_ttl=app.config["USER_CACHE_TTL"],
+    name="users",
+)
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message, headers=()):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = list(headers)
+
+
+class Request:
+    def __init__(self, scope):
+        self.method = scope["method"]
+        self.path = scope["path"]
+        self.query_string = scope.get("query_string", b"").decode("latin-1")
+        self.args = parse_qsl(self.query_string, keep_blank_values=True)
+        self.headers = {
+            name.decode("latin-1").lower(): value.decode("latin-1")
+            for name, value in scope.get("headers", ())
+        }
+        self.cookies = parse_cookie(self.headers.get("cookie", ""))
+
+    def arg(self, name, default=None):
+        for key, value in self.args:
+            if key == name:
+                return value
+        return default
+
+
+# Authentication: the signed Flask session cookie set by /login
+def session_data(request):
+    serializer = app.session_interface.get_signing_serializer(app)
+    token = request.cookies.get(app.config["SESSION_COOKIE_NAME"])
+    if serializer is None or not token:
+        return {}
+    max_age = int(app.permanent_session_lifetime.total_seconds())
+    try:
+        return serializer.loads(token, max_age=max_age)
+    except BadSignature:
+        return {}
+
+
+def session_user_id(data):
+    try:
+        return int(data.get("_user_id"))
+    except (TypeError, ValueError):
+        return None
+
+
+async def require_user(session, request, data):
+    user_id = session_user_id(data)
+    if user_id is not None and known_users.get(user_id) is None:
+        exists = await session.scalar(select(User.id).where(User.id == user_id))
+        if exists is not None:
+            known_users.set(user_id, True)
+        else:
+            user_id = None
+    if user_id is None:
+        # What login_required does on the Flask side
+        target = request.path + ("?" + request.query_string if request.args else "")
+        location = "/login?" + urlencode({"next": target}, quote_via=quote)
+        raise HTTPError(302, "Login required", [("location", location)])
+    return user_id
+
+
+# Cache versions (see listing_version / dish_version in app.py)
+async def listing_version(session, **view_args):
+    value = await session.scalar(
+        select(AppSetting.value).where(AppSetting.key == CATALOG_VERSION_KEY)
+    )
+    return int(value) if value is not None else 0
+
+
+async def dish_version(session, dish_id):
+    return await session.scalar(select(Dish.version).where(Dish.id == dish_id))
+
+
+# Views
+async def paginated_dishes(session, request, query="", sort=None):
+    tag_terms = None
+    use_fts = search_index.is_available(engine)
+    terms = search_index.split_terms(query)
+    if terms and use_fts:
+        rows = await session.execute(search_index.exact_tag_terms_statement(terms))
+        tag_terms = set(rows.scalars())
+    stmt, score = search_index.apply_search(
+        select(Dish), query, tag_terms=tag_terms, use_fts=use_fts
+    )
+    stmt = stmt.options(*dish_document_options())
+    keys, descending, scope = listing_order(query, sort, score)
+
+    try:
+        stmt, width, limit = page_statement(
+            stmt,
+            keys,
+            descending,
+            limit=parse_limit(request.arg("limit")),
+            cursor=request.arg("cursor"),
+            scope=scope,
+        )
+    except InvalidCursor:
+        raise HTTPError(400, "Invalid cursor")
+    rows = (await session.execute(stmt)).all()
+    return split_page(rows, width, limit, scope)
+
+
+async def documents(session, dishes, variant):
+    return await session.run_sync(
+        lambda sync_session: dish_documents(dishes, variant, session=sync_session)
+    )
+
+
+async def page_body(session, dishes, next_cursor, path, **params):
+    next_url = None
+    if next_cursor:
+        query = {"cursor": next_cursor, **params}
+        items = [(key, value) for key, value in query.items() if value is not None]
+        # Encoded like Werkzeug's url_for(), so the links match the Flask API
+        next_url = path + "?" + urlencode(items, safe="!$'()*,/:;?@")
+    variant = document_variant(params.get("view"))
+    return document_page(
+        await documents(session, dishes, variant),
+        next_cursor=next_cursor,
+        next=next_url,
+    )
+
+
+async def api_dishes(session, request):
+    sort = request.arg("sort")
+    limit = parse_limit(request.arg("limit"))
+    view = request.arg("view")
+    dishes, next_cursor = await paginated_dishes(session, request, sort=sort)
+    return await page_body(
+        session, dishes, next_cursor, "/api/dishes", sort=sort, limit=limit, view=view
+    )
+
+
+async def api_dish_detail(session, request, dish_id):
+    result = await session.execute(
+        select(Dish).where(Dish.id == dish_id).options(*dish_document_options())
+    )
+    dish = result.scalars().first()
+    if dish is None:
+        raise HTTPError(404, "Not found")
+    return (await documents(session, [dish], "full"))[0] + "\n"
+
+
+async def api_search(session, request):
+    query = request.arg("q", "")
+    sort = request.arg("sort")
+    limit = parse_limit(request.arg("limit"))
+    view = request.arg("view")
+    dishes, next_cursor = await paginated_dishes(session, request, query, sort)
+    return await page_body(
+        session,
+        dishes,
+        next_cursor,
+        "/api/search",
+        q=query,
+        sort=sort,
+        limit=limit,
+        view=view,
+    )
+
+
+# (pattern, endpoint, view, version) - endpoints match the Flask view names
+ROUTES = [
+    (re.compile(r"/api/dishes"), "api_dishes", api_dishes, listing_version),
+    (
+        re.compile(r"/api/dishes/(?P<dish_id>\d+)"),
+        "api_dish_detail",
+        api_dish_detail,
+        dish_version,
+    ),
+    (re.compile(r"/api/search"), "api_search", api_search, listing_version),
+]
+
+
+def match_route(path):
+    for pattern, endpoint, view, version_for in ROUTES:
+        match = pattern.fullmatch(path)
+        if match:
+            view_args = {name: int(value) for name, value in match.groupdict().items()}
+            return endpoint, view, version_for, view_args
+    raise HTTPError(404, "Not found")
+
+
+async def handle(request):
+    """(status, headers, body) for an API request"""
+    if request.method not in ("GET", "HEAD"):
+        raise HTTPError(405, "Method not allowed", [("allow", "GET, HEAD")])
+    endpoint, view, version_for, view_args = match_route(request.path)
+
+    data = session_data(request)
+    if recently_wrote(data, app.config["REPLICA_STICKY_SECONDS"]):
+        bind = engine
+    else:
+        bind = replica_engine
+    async with async_session(bind=bind) as session:
+        await require_user(session, request, data)
+        version = await version_for(session, **view_args)
+        if version is None:
+            # Let the view produce its 404
+            await view(session, request, **view_args)
+
+        # Same key and ETag as response_cache.ResponseCache.cached()
+        key = (
+            endpoint,
+            tuple(sorted(view_args.items())),
+            tuple(sorted(request.args)),
+            version,
+        )
+        etag = hashlib.sha1(repr(key).encode()).hexdigest()
+        headers = [
+            ("etag", f'"{etag}"'),
+            ("cache-control", "private, no-cache"),
+        ]
+        if f'"{etag}"' in request.headers.get("if-none-match", ""):
+            return 304, headers, b""
+
+        body = responses.get(key)
+        if body is None:
+            body = (await view(session, request, **view_args)).encode()
+            responses.set(key, body)
+    return 200, [("content-type", "application/json")] + headers, body
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                # Same schema checks as the Flask server's first run
+                with app.app_context():
+                    prepare_database()
+                    print(
+                        sqlite_profile.report(db.engine, app.config["SQLITE_PRAGMAS"])
+                    )
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await engine.dispose()
+                await replica_engine.dispose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    if scope["type"] != "http":
+        return
+
+    request = Request(scope)
+    try:
+        status, headers, body = await handle(request)
+    except HTTPError as e:
+        status = e.status
+        headers = [("content-type", "application/json")] + e.headers
+        body = (app.json.dumps({"error": e.message}) + "\n").encode()
+
+    headers.append(("content-length", str(len(body))))
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(name.encode(), value.encode()) for name, value in headers],
+        }
+    )
+    await send(
+        {
+            "type": "http.response.body",
+            "body": b"" if request.method == "HEAD" else body,
+        }
+    )
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run("asgi:application", port=8000)
@@ -0,0 +1,108 @@
+import argparse
+import json
+import os
+import sys
+import timeit
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from throwaway import app, logged_in_client, seed
+import models
+from models import Dish
+
+# JSON decoding per rendered page
+#
+# Counts how often a page reads Dish.ingredients / preparation / tags, and
+# how many of those reads actually decode JSON or rebuild the tag list.
+# Before JSONText and the tag memo, every read was a decode.
+PAGES = ["/dishes?limit={n}", "/api/dishes?limit={n}", "/dish/1", "/api/dishes/1"]
+
+
+def dish_fields(i):
+    return {
+        "ingredients": [f"{j} cups of ingredient {j}" for j in range(12)],
+        "preparation": [f"Step {j}: stir for {j} minutes" for j in range(8)],
+        "tags": ["Dinner", "Quick", f"Tag{i % 5}", f"Cuisine{i % 7}"],
+    }
+
+
+class Counter:
+    def __init__(self):
+        self.reads = 0
+        self.decodes = 0
+
+
+def instrument(counter):
+    """Count property reads and actual decodes; returns an undo function"""
+    original_loads = models.json_loads
+    originals = {name: getattr(Dish, name) for name in ("ingredients", "preparation")}
+    original_tags = Dish.tags
+
+    def counting_loads(text):
+        counter.decodes += 1
+        return original_loads(text)
+
+    def counting(prop):
+        def fget(dish):
+            counter.reads += 1
+            return prop.fget(dish)
+
+        return property(fget, prop.fset)
+
+    def counting_tags(dish):
+        counter.reads += 1
+        if "_tag_names" not in dish.__dict__:
+            counter.decodes += 1
+        return original_tags.fget(dish)
+
+    models.json_loads = counting_loads
+    for name, prop in originals.items():
+        setattr(Dish, name, counting(prop))
+    Dish.tags = property(counting_tags, original_tags.fset)
+
+    def undo():
+        models.json_loads = original_loads
+        for name, prop in originals.items():
+            setattr(Dish, name, prop)
+        Dish.tags = original_tags
+
+    return undo
+
+
+def codec_timings(number=20000):
+    value = [f"{j} cups of ingredient {j}" for j in range(12)]
+    text = json.dumps(value)
+    timings = {"json": timeit.timeit(lambda: json.loads(text), number=number)}
+    if models.orjson is not None:
+        timings["orjson"] = timeit.timeit(
+            lambda: models.orjson.loads(text), number=number
+        )
+    return {name: seconds * 1e6 / number for name, seconds in timings.items()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="JSON decodes per rendered page")
+    parser.add_argument("--dishes", type=int, default=24)
+    args = parser.parse_args()
+
+    app.config["TESTING"] = True
+    with app.app_context():
+        user_id = seed(args.dishes, reviewers=1, rated=False, dish_fields=dish_fields)
+    client = logged_in_client(user_id)
+
+    print(f"\n{args.dishes} dishes, 12 ingredients, 8 steps, 4 tags each")
+    print(f"{'page':28} {'reads':>6} {'decodes':>8}")
+    for page in PAGES:
+        url = page.format(n=args.dishes)
+        counter = Counter()
+        undo = instrument(counter)
+        try:
+            # The extra parameter keeps the API response cache out of it
+            response = client.get(url + ("&" if "?" in url else "?") + "_=1")
+        finally:
+            undo()
+        assert response.status_code == 200, (url, response.status_code)
+        print(f"{url:28} {counter.reads:>6} {counter.decodes:>8}")
+
+    print(f"\n{'codec':8} {'us/decode':>10}")
+    for name, micros in codec_timings().items():
+        print(f"{name:8} {micros:>10.2f}")
@@ -0,0 +1,56 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from throwaway import app
+from app import prepare_database
+from importer import import_users
+
+
+def worker_counts(max_workers):
+    """1, 2, 4, ... up to max_workers (always included)"""
+    counts = []
+    workers = 1
+    while workers < max_workers:
+        counts.append(workers)
+        workers *= 2
+    counts.append(max_workers)
+    return counts
+
+
+def bench(num_users, workers, run):
+    records = [
+        {"username": f"bench{run}_{i}", "password": f"password{i}"}
+        for i in range(num_users)
+    ]
+    with app.app_context():
+        started = time.perf_counter()
+        import_users(records, workers=workers)
+        return time.perf_counter() - started
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Bulk user import throughput by hashing worker count"
+    )
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    with app.app_context():
+        prepare_database()
+
+    results = []
+    for run, workers in enumerate(worker_counts(args.max_workers)):
+        results.append((workers, bench(args.users, workers, run)))
+
+    print(f"\n{os.cpu_count()} cores, {args.users} users per run")
+    print(f"{'workers':>8} {'seconds':>10} {'users/sec':>10} {'speedup':>8}")
+    baseline = results[0][1]
+    for workers, elapsed in results:
+        print(
+            f"{workers:>8} {elapsed:>10.2f} {args.users / elapsed:>10.1f}"
+            f" {baseline / elapsed:>7.2f}x"
+        )
@@ -0,0 +1,207 @@
+import argparse
+import json
+import logging
+import os
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+# Read/write throughput under concurrent writers, default SQLite settings
+# against the sqlite_profile.py tuning:
+#
+#     python bench_sqlite.py --writers 1,4,8 --readers 8 --duration 5
+#
+# Each run gets its own copy of food_app.db (journal mode is stored in the
+# file) and a fresh process (the profile is read at import). Writers POST
+# /rate as their own user; readers GET /api/dishes with a unique query
+# string so the response cache can't answer them.
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+PROFILES = {
+    # SQLAlchemy/pysqlite defaults: pysqlite's 5 s busy timeout and a
+    # 5 + 10 connection pool
+    "default": {
+        "SQLITE_PRAGMAS": "journal_mode=DELETE,synchronous=FULL,cache_size=-2000,"
+        "mmap_size=0,temp_store=DEFAULT",
+        "SQLITE_POOL_SIZE": "5",
+        "SQLITE_MAX_OVERFLOW": "10",
+    },
+    "tuned": {},
+}
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    index = min(int(p * len(sorted_values) / 100), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def copy_database(path):
+    """Consistent copy of food_app.db; the original is only read"""
+    source = sqlite3.connect(
+        f"file:{os.path.join(HERE, 'food_app.db')}?mode=ro", uri=True
+    )
+    target = sqlite3.connect(path)
+    with target:
+        source.backup(target)
+    source.close()
+    target.close()
+
+
+def run_profile(writers, readers, duration):
+    """Runs in the child process; prints one JSON line of results"""
+    sys.path.append(HERE)
+    from app import app, prepare_database
+    from models import db, Dish, User
+
+    app.config["TESTING"] = True
+    with app.app_context():
+        prepare_database()
+        dish_ids = db.session.scalars(db.select(Dish.id)).all()
+        user_ids = db.session.scalars(db.select(User.id).limit(writers)).all()
+        for i in range(len(user_ids), writers):
+            user = User(username=f"bench_writer_{i}", password_hash="x")
+            db.session.add(user)
+            db.session.flush()
+            user_ids.append(user.id)
+        db.session.commit()
+
+    # rate_dish logs and swallows failed commits ("database is locked")
+    failures = []
+
+    class FailureCounter(logging.Handler):
+        def emit(self, record):
+            failures.append(record.getMessage())
+
+    app.logger.addHandler(FailureCounter(level=logging.ERROR))
+
+    deadline = time.perf_counter() + duration
+    results = {"write": [], "read": []}
+    errors = {"write": 0, "read": 0}
+    lock = threading.Lock()
+
+    def client(kind, user_id, seed):
+        rng = random.Random(seed)
+        latencies, failed = [], 0
+        with app.test_client() as client:
+            with client.session_transaction() as session:
+                session["_user_id"] = str(user_id)
+                session["_fresh"] = True
+            n = 0
+            while time.perf_counter() < deadline:
+                n += 1
+                started = time.perf_counter()
+                if kind == "write":
+                    response = client.post(
+                        "/rate",
+                        data={
+                            "dish_id": rng.choice(dish_ids),
+                            "rating": rng.randint(1, 5),
+                            "comment": "Benchmark review",
+                        },
+                    )
+                    ok = response.status_code == 302
+                else:
+                    response = client.get(
+                        f"/api/dishes?sort=rating&limit=24&_={seed}-{n}"
+                    )
+                    ok = response.status_code == 200
+                if ok:
+                    latencies.append(time.perf_counter() - started)
+                else:
+                    failed += 1
+        with lock:
+            results[kind].extend(latencies)
+            errors[kind] += failed
+
+    threads = [
+        threading.Thread(target=client, args=("write", user_ids[i], i))
+        for i in range(writers)
+    ] + [
+        threading.Thread(target=client, args=("read", user_ids[0], 1000 + i))
+        for i in range(readers)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    summary = {"failed_writes": len(failures)}
+    for kind, latencies in results.items():
+        latencies.sort()
+        summary[kind] = {
+            "ops": len(latencies) / elapsed,
+            "p99_ms": percentile(latencies, 99) * 1000,
+            "errors": errors[kind],
+        }
+    summary["write"]["ops"] -= len(failures) / elapsed
+    print(json.dumps(summary))
+
+
+def spawn(profile, writers, readers, duration, tmp_dir):
+    path = os.path.join(tmp_dir, f"{profile}_{writers}.db")
+    copy_database(path)
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{path}", **PROFILES[profile])
+    output = subprocess.run(
+        [
+            sys.executable,
+            __file__,
+            "--child",
+            "--writers",
+            str(writers),
+            "--readers",
+            str(readers),
+            "--duration",
+            str(duration),
+        ],
+        env=env,
+        cwd=HERE,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SQLite profile read/write bench")
+    parser.add_argument("--writers", default="1,4,8", help="comma separated")
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_profile(int(args.writers), args.readers, args.duration)
+        sys.exit()
+
+    tmp_dir = tempfile.mkdtemp(prefix="dishfinder_sqlite_")
+    rows = []
+    try:
+        for writers in map(int, args.writers.split(",")):
+            for profile in PROFILES:
+                stats = spawn(profile, writers, args.readers, args.duration, tmp_dir)
+                rows.append((profile, writers, stats))
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    print(f"\n{args.readers} readers, {args.duration:g}s per run")
+    print(
+        f"{'profile':8} {'writers':>7} {'writes/s':>9} {'w p99 ms':>9}"
+        f" {'failed':>7} {'reads/s':>8} {'r p99 ms':>9}"
+    )
+    for profile, writers, stats in rows:
+        write, read = stats["write"], stats["read"]
+        print(
+            f"{profile:8} {writers:>7} {write['ops']:>9.1f} {write['p99_ms']:>9.1f}"
+            f" {stats['failed_writes'] + write['errors']:>7}"
+            f" {read['ops']:>8.1f} {read['p99_ms']:>9.1f}"
+        )
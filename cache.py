@@ -0,0 +1,354 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def _size_of(value):
+    """Approximate size of a cached value in bytes"""
+    if isinstance(value, (bytes, bytearray, str)):
+        return len(value)
+    if isinstance(value, (tuple, list)):
+        return sum(_size_of(item) for item in value)
+    return 64
+
+
+class LRUCache:
+    """
+    Thread-safe least-recently-used cache bounded by entry count and by the
+    approximate total size of its values.
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=None, on_evict=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.on_evict = on_evict
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def size_bytes(self):
+        return self._bytes
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                _, value = self._entries[key]
+            except KeyError:
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, size=None):
+        size = _size_of(value) if size is None else size
+        with self._lock:
+            if self.max_bytes is not None and size > self.max_bytes:
+                return False
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[0]
+            self._entries[key] = (size, value)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or (
+                self.max_bytes is not None and self._bytes > self.max_bytes
+            ):
+                evicted_key, (evicted_size, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+                if self.on_evict is not None:
+                    self.on_evict(evicted_key, evicted)
+            return True
+
+    def pop(self, key, default=None):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is None:
+                return default
+            self._bytes -= old[0]
+            return old[1]
+
+    def delete(self, key):
+        self.pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+# Cache backends
+#
+# A backend stores (value, expires_at, tags) under a key and can drop every
+# entry carrying a tag. Expiry is checked by the Cache front end, so backends
+# only need to hand back what they stored.
+class MemoryBackend:
+    """Per-process LRU backend (the default)"""
+
+    def __init__(self, max_entries=1024, max_bytes=None):
+        self._lock = threading.RLock()
+        self._tags = {}
+        self.entries = LRUCache(max_entries, max_bytes, on_evict=self._forget)
+
+    @property
+    def evictions(self):
+        return self.entries.evictions
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _forget(self, key, entry):
+        for tag in entry[2]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def set(self, key, value, expires_at, tags):
+        with self._lock:
+            self.delete(key)
+            entry = (value, expires_at, tuple(tags))
+            if self.entries.set(key, entry, size=_size_of(value)):
+                for tag in entry[2]:
+                    self._tags.setdefault(tag, set()).add(key)
+
+    def delete(self, key):
+        with self._lock:
+            entry = self.entries.pop(key)
+            if entry is not None:
+                self._forget(key, entry)
+
+    def invalidate_tags(self, tags):
+        with self._lock:
+            for tag in tags:
+                for key in list(self._tags.get(tag, ())):
+                    self.delete(key)
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self._tags.clear()
+
+
+class SQLiteBackend:
+    """
+    Backend shared by every worker process on the host, stored in a small
+    SQLite file next to the app. Values are pickled.
+    """
+
+    def __init__(self, path, max_entries=10000):
+        self.path = path
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS cache_entries (
+                    key TEXT PRIMARY KEY,
+                    value BLOB NOT NULL,
+                    expires_at REAL,
+                    accessed_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS ix_cache_entries_accessed_at
+                    ON cache_entries (accessed_at);
+                CREATE TABLE IF NOT EXISTS cache_tags (
+                    tag TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    PRIMARY KEY (tag, key)
+                );
+                CREATE INDEX IF NOT EXISTS ix_cache_tags_key ON cache_tags (key);
+                """)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def __len__(self):
+        return (
+            self._connect().execute("SELECT COUNT(*) FROM cache_entries").fetchone()[0]
+        )
+
+    def get(self, key):
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT value, expires_at FROM cache_entries WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute(
+            "UPDATE cache_entries SET accessed_at = ? WHERE key = ?",
+            (time.time(), key),
+        )
+        return pickle.loads(row[0]), row[1], ()
+
+    def set(self, key, value, expires_at, tags):
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM cache_tags WHERE key = ?", (key,))
+            conn.execute(
+                "INSERT OR REPLACE INTO cache_entries "
+                "(key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, pickle.dumps(value), expires_at, time.time()),
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO cache_tags (tag, key) VALUES (?, ?)",
+                [(tag, key) for tag in tags],
+            )
+            self._evict(conn)
+
+    def _evict(self, conn):
+        count = conn.execute("SELECT COUNT(*) FROM cache_entries").fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            keys = [
+                row[0]
+                for row in conn.execute(
+                    "SELECT key FROM cache_entries ORDER BY accessed_at LIMIT ?",
+                    (excess,),
+                )
+            ]
+            self._delete_keys(conn, keys)
+            self.evictions += len(keys)
+
+    @staticmethod
+    def _delete_keys(conn, keys):
+        conn.executemany(
+            "DELETE FROM cache_entries WHERE key = ?", [(k,) for k in keys]
+        )
+        conn.executemany("DELETE FROM cache_tags WHERE key = ?", [(k,) for k in keys])
+
+    def delete(self, key):
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            self._delete_keys(conn, [key])
+
+    def invalidate_tags(self, tags):
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            placeholders = ",".join("?" for _ in tags)
+            keys = [
+                row[0]
+                for row in conn.execute(
+                    f"SELECT DISTINCT key FROM cache_tags WHERE tag IN ({placeholders})",
+                    list(tags),
+                )
+            ]
+            self._delete_keys(conn, keys)
+
+    def clear(self):
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM cache_entries")
+            conn.execute("DELETE FROM cache_tags")
+
+
+class Cache:
+    """
+    Cache front end: per-entry TTLs, tag-based invalidation and hit/miss
+    counters on top of a pluggable backend.
+
+        cache.set("stats:2024-01", stats, ttl=300, tags=["reviews"])
+        cache.invalidate_tags("reviews")   # drops every entry tagged "reviews"
+    """
+
+    def __init__(self, backend=None, default_ttl=None, name="cache"):
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.default_ttl = default_ttl
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def _backend_key(self, key):
+        # The shared backend holds several caches' entries in one table
+        if isinstance(self.backend, SQLiteBackend):
+            return f"{self.name}:{key if isinstance(key, str) else repr(key)}"
+        return key
+
+    def get(self, key, default=None):
+        key = self._backend_key(key)
+        entry = self.backend.get(key)
+        if entry is not None:
+            value, expires_at, _ = entry
+            if expires_at is None or expires_at > time.time():
+                self.hits += 1
+                return value
+            self.backend.delete(key)
+            self.expirations += 1
+        self.misses += 1
+        return default
+
+    def set(self, key, value, ttl=None, tags=()):
+        ttl = self.default_ttl if ttl is None else ttl
+        expires_at = time.time() + ttl if ttl else None
+        self.backend.set(self._backend_key(key), value, expires_at, tags)
+
+    def get_or_set(self, key, compute, ttl=None, tags=()):
+        """Return the cached value, computing and storing it on a miss"""
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = compute()
+            self.set(key, value, ttl=ttl, tags=tags)
+        return value
+
+    def delete(self, key):
+        self.backend.delete(self._backend_key(key))
+
+    def invalidate_tags(self, *tags):
+        if tags:
+            self.backend.invalidate_tags(tags)
+            self.invalidations += 1
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "entries": len(self.backend),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "evictions": self.backend.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+
+def create_cache(config, name, default_ttl=None, max_entries=1024, max_bytes=None):
+    """
+    Build a Cache using the backend named by config["CACHE_BACKEND"]:
+    "memory" (per process, default) or "sqlite" (shared by all workers on
+    the host via config["CACHE_SQLITE_PATH"]).
+    """
+    backend_name = config.get("CACHE_BACKEND", "memory")
+    if backend_name == "sqlite":
+        path = config.get("CACHE_SQLITE_PATH") or os.path.abspath("cache.db")
+        backend = SQLiteBackend(path, max_entries=max_entries)
+    elif backend_name == "memory":
+        backend = MemoryBackend(max_entries=max_entries, max_bytes=max_bytes)
+    else:
+        raise ValueError(f"Unknown CACHE_BACKEND: {backend_name!r}")
+    return Cache(backend, default_ttl=default_ttl, name=name)
@@ -14,8 +14,7 @@ with app.app_context():
     # Reviews per dish
     dish_stats = []
     for dish in Dish.query.all():
-        review_count = len(dish.reviews)
-        dish_stats.append((dish.id, dish.name, review_count, dish.avg_rating))
+        dish_stats.append((dish.id, dish.name, dish.review_count, dish.avg_rating))
 
     # Print summary
     print(f"Total users: {total_users}")
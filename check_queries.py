@@ -0,0 +1,258 @@
+import base64
+import json
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from throwaway import app, logged_in_client, seed
+from models import db, User, Dish, Review
+from query_plans import count_queries, dish_card_columns, full_scans
+
+
+def queries_per_request(url, num_dishes):
+    with app.app_context():
+        user_id = seed(num_dishes)
+
+    client = logged_in_client(user_id)
+
+    with app.app_context():
+        with count_queries() as counter:
+            response = client.get(url)
+    assert response.status_code == 200, f"{url} returned {response.status_code}"
+    return counter.count
+
+
+def raw_cursor(payload):
+    raw = json.dumps(payload).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def cursor_statuses(num_dishes=50):
+    """
+    (url, expected, actual) status codes for cursors reused across sort
+    orders and searches, or holding values of the wrong type
+    """
+    with app.app_context():
+        user_id = seed(num_dishes)
+    client = logged_in_client(user_id)
+
+    name_cursor = client.get("/api/dishes?sort=name&limit=5").json["next_cursor"]
+    search_cursor = client.get("/api/search?q=chicken&limit=5").json["next_cursor"]
+    cases = [
+        (f"/api/dishes?sort=name&cursor={name_cursor}", 200),
+        (f"/api/dishes?sort=newest&cursor={name_cursor}", 400),
+        (f"/api/dishes?sort=rating&cursor={name_cursor}", 400),
+        (f"/api/dishes?cursor={name_cursor}", 400),
+        (f"/dishes?sort=newest&cursor={name_cursor}", 400),
+        (f"/api/search?q=chicken&cursor={name_cursor}", 400),
+        (f"/api/search?q=chicken&cursor={search_cursor}", 200),
+        (f"/api/search?q=rice&cursor={search_cursor}", 400),
+        (f"/api/dishes?cursor={raw_cursor([{'dt': 1}])}", 400),
+        (f"/api/dishes?cursor={raw_cursor([[1]])}", 400),
+        (f"/api/dishes?cursor={raw_cursor({'s': ['id', ''], 'v': [[1]]})}", 400),
+        (f"/api/dishes?cursor={raw_cursor({'s': ['id', ''], 'v': ['x']})}", 400),
+        (
+            "/api/dishes?sort=newest&cursor="
+            + raw_cursor({"s": ["newest", ""], "v": ["Dish 1", 1]}),
+            400,
+        ),
+        (
+            "/api/dishes?sort=name&cursor="
+            + raw_cursor({"s": ["name", ""], "v": [{"dt": "2024-01-01"}, 1]}),
+            400,
+        ),
+        ("/api/dishes?cursor=not-a-cursor", 400),
+    ]
+    return [(url, expected, client.get(url).status_code) for url, expected in cases]
+
+
+def single_dish_recount(num_dishes=50):
+    """
+    (other dishes whose version changed, whether the recounted dish's
+    changed) after Dish.update_avg_rating() on one dish
+    """
+    with app.app_context():
+        seed(num_dishes)
+        versions = dict(db.session.execute(db.select(Dish.id, Dish.version)).all())
+        dish = db.session.get(Dish, 1)
+        dish.update_avg_rating()
+        after = dict(db.session.execute(db.select(Dish.id, Dish.version)).all())
+    others = [i for i in versions if i != 1 and after[i] != versions[i]]
+    return others, after[1] != versions[1]
+
+
+def rate_version_bumps(num_dishes=5):
+    """
+    (request, Dish.version bumps, catalog version bumps) for a new review
+    and an edited one through /rate; each should bump both once
+    """
+    from models import catalog_version
+
+    with app.app_context():
+        user_id = seed(num_dishes, reviewers=1, rated=False)
+    client = logged_in_client(user_id)
+
+    bumps = []
+    for request, rating in (("new review", 5), ("edited review", 2)):
+        with app.app_context():
+            before = db.session.get(Dish, 1).version, catalog_version()
+        response = client.post(
+            "/rate", data={"dish_id": 1, "rating": rating, "comment": "Tasty"}
+        )
+        assert response.status_code == 302, f"/rate returned {response.status_code}"
+        with app.app_context():
+            after = db.session.get(Dish, 1).version, catalog_version()
+        bumps.append((request, after[0] - before[0], after[1] - before[1]))
+    return bumps
+
+
+def search_scans(num_dishes=50):
+    """
+    (query, sort, plan lines) for searches whose plan scans the whole
+    dishes table; searches should start from the FTS index and tag tables
+    """
+    from app import dish_listing
+    from pagination import page_statement
+
+    with app.app_context():
+        seed(num_dishes)
+        scans = []
+        # "dinner" names a tag; "chicken" only matches descriptions
+        for query in ("dinner", "chicken", "dinner, chicken"):
+            for sort in (None, "name", "rating", "newest"):
+                stmt, keys, descending, _ = dish_listing(
+                    query, sort, columns=dish_card_columns()
+                )
+                stmt, _, _ = page_statement(stmt, keys, descending)
+                lines = full_scans(stmt, "dishes")
+                if lines:
+                    scans.append((query, sort, lines))
+    return scans
+
+
+def rollup_drift(num_dishes=10):
+    """
+    Mismatches between the dashboard and the source tables after writing
+    through the ORM the way the synthetic data generators do: new users
+    and reviews, a changed rating and a deleted review
+    """
+    import stats
+    from models import ROLLUP_MODELS, rebuild_stats_rollups
+
+    def snapshot():
+        rows = {}
+        for model in ROLLUP_MODELS:
+            columns = model.__table__.columns
+            counts = [c for c in columns if not c.primary_key]
+            rows[model.__tablename__] = {
+                tuple(row[: -len(counts)]): tuple(row[-len(counts) :])
+                for row in db.session.execute(
+                    db.select(*[c for c in columns if c.primary_key], *counts)
+                )
+                if any(row[-len(counts) :])  # emptied rows aren't rebuilt
+            }
+        return rows
+
+    mismatches = []
+    with app.app_context():
+        seed(num_dishes)
+        dish_ids = db.session.scalars(db.select(Dish.id)).all()
+        users = [User(username=f"generated{i}", password_hash="x") for i in range(4)]
+        db.session.add_all(users)
+        db.session.commit()
+        for i in range(20):
+            db.session.add(
+                Review(
+                    dish_id=dish_ids[i % len(dish_ids)],
+                    user_id=users[i % len(users)].id,
+                    rating=1 + i % 5,
+                    comment="Generated",
+                )
+            )
+            if i % 7 == 6:
+                db.session.commit()
+        db.session.commit()
+        review = db.session.scalars(db.select(Review).limit(1)).first()
+        review.rating = 6 - review.rating if review.rating != 3 else 4
+        db.session.delete(db.session.scalars(db.select(Review).offset(3)).first())
+        db.session.commit()
+
+        totals = stats.catalog_totals()
+        exact = {
+            "users": db.session.query(db.func.count(User.id)).scalar(),
+            "dishes": db.session.query(db.func.count(Dish.id)).scalar(),
+            "reviews": db.session.query(db.func.count(Review.id)).scalar(),
+        }
+        mismatches += [
+            f"catalog_totals()[{name!r}] = {totals[name]}, COUNT(*) = {count}"
+            for name, count in exact.items()
+            if totals[name] != count
+        ]
+        distribution = stats.rating_distribution()
+        if sum(distribution.values()) != exact["reviews"]:
+            mismatches.append(f"rating_distribution() = {distribution}")
+
+        maintained = snapshot()
+        rebuild_stats_rollups()
+        rebuilt = snapshot()
+        db.session.rollback()
+        mismatches += [
+            f"{table} differs from a rebuild"
+            for table in rebuilt
+            if maintained[table] != rebuilt[table]
+        ]
+    return mismatches
+
+
+URLS = [
+    "/api/dishes?limit=100",
+    "/api/search?q=chicken&limit=100",
+    "/dishes?limit=100",
+    "/dish/1",
+]
+
+if __name__ == "__main__":
+    app.config["TESTING"] = True
+    failed = False
+    print(f"{'URL':40} {'2 dishes':>10} {'50 dishes':>10}")
+    for url in URLS:
+        small = queries_per_request(url, 2)
+        large = queries_per_request(url, 50)
+        ok = small == large
+        failed |= not ok
+        print(f"{url:40} {small:>10} {large:>10}  {'ok' if ok else 'N+1!'}")
+
+    others, bumped = single_dish_recount()
+    ok = bumped and not others
+    failed |= not ok
+    print(
+        f"\nupdate_avg_rating() on one dish: {len(others)} other dish versions"
+        f" changed  {'ok' if ok else 'FAIL'}"
+    )
+
+    for request, version_bumps, catalog_bumps in rate_version_bumps():
+        ok = version_bumps == catalog_bumps == 1
+        failed |= not ok
+        print(
+            f"/rate ({request}): Dish.version +{version_bumps}, catalog version"
+            f" +{catalog_bumps}  {'ok' if ok else 'FAIL'}"
+        )
+
+    drift = rollup_drift()
+    failed |= bool(drift)
+    print(f"\nDashboard rollup drift: {len(drift)}  {'FAIL' if drift else 'ok'}")
+    for line in drift:
+        print(f"  {line}")
+
+    scans = search_scans()
+    failed |= bool(scans)
+    print(f"\nSearch plans scanning dishes: {len(scans)}  {'FAIL' if scans else 'ok'}")
+    for query, sort, lines in scans:
+        print(f"  q={query!r} sort={sort}: {'; '.join(lines)}")
+
+    print(f"\n{'Cursor':60} {'expected':>8} {'status':>7}")
+    for url, expected, status in cursor_statuses():
+        ok = status == expected
+        failed |= not ok
+        print(f"{url[:60]:60} {expected:>8} {status:>7}  {'ok' if ok else 'FAIL'}")
+    sys.exit(1 if failed else 0)
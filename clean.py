@@ -3,7 +3,7 @@ import sys
 from sqlalchemy import not_
 
 from app import app
-from models import db, User, Review
+from models import db, User, Dish, Review, rebuild_stats_rollups
 
 
 def main():
@@ -30,6 +30,9 @@ def main():
         db.session.query(Review).filter(~Review.user_id.in_(keep_ids)).delete(
             synchronize_session=False
         )
+        # Bulk deletes bypass the per-review bookkeeping, so recount
+        Dish.recompute_rating_aggregates()
+        rebuild_stats_rollups()
         db.session.commit()
 
         # Count total reviews after deletion
@@ -0,0 +1,91 @@
+import csv
+import io
+import zlib
+
+from models import db, Dish, Review, User
+
+# Streaming exports
+#
+# Rows come from one joined query read through a server-side cursor in
+# batches of EXPORT_BATCH_SIZE, and are written out a batch at a time, so
+# memory use stays flat however many rows are exported and the first bytes
+# go out before the query has finished.
+EXPORT_BATCH_SIZE = 1000
+
+REVIEW_EXPORT_HEADER = (
+    "review_id",
+    "dish_id",
+    "dish_name",
+    "user_id",
+    "username",
+    "rating",
+    "date",
+    "comment",
+)
+
+
+def review_export_rows(start_dt, end_dt, batch_size=EXPORT_BATCH_SIZE):
+    """Yield review rows created in [start_dt, end_dt), oldest first"""
+    stmt = (
+        db.select(
+            Review.id,
+            Review.dish_id,
+            Dish.name,
+            Review.user_id,
+            User.username,
+            Review.rating,
+            Review.date,
+            Review.comment,
+        )
+        .outerjoin(Dish, Dish.id == Review.dish_id)
+        .outerjoin(User, User.id == Review.user_id)
+        .where(Review.created_at >= start_dt, Review.created_at < end_dt)
+        .order_by(Review.created_at, Review.id)
+        .execution_options(yield_per=batch_size)
+    )
+    for row in db.session.execute(stmt):
+        review_id, dish_id, dish_name, user_id, username, rating, day, comment = row
+        yield (
+            review_id,
+            dish_id,
+            dish_name or "",
+            user_id,
+            username or "",
+            rating,
+            day.isoformat() if day is not None else "",
+            comment or "",
+        )
+
+
+def iter_csv(rows, header, batch_size=EXPORT_BATCH_SIZE):
+    """Encode rows as CSV, yielding one chunk of bytes per batch"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, quoting=csv.QUOTE_ALL, lineterminator="\n")
+
+    def drain():
+        chunk = buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+        return chunk
+
+    writer.writerow(header)
+    yield drain()
+    pending = 0
+    for row in rows:
+        writer.writerow(row)
+        pending += 1
+        if pending >= batch_size:
+            yield drain()
+            pending = 0
+    if pending:
+        yield drain()
+
+
+def gzip_chunks(chunks, level=6):
+    """Compress a stream of byte chunks into a single gzip member"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,41 @@
+from flask import render_template
+from markupsafe import Markup
+
+from cache import Cache, MemoryBackend
+
+# Template fragment cache
+#
+# Rendered partials are cached under a versioned key, the same way the
+# response cache works: a key like ("dish_card", dish.id, dish.version)
+# changes whenever anything the fragment shows changes, so nothing is ever
+# invalidated and old entries simply age out of the LRU. A page then only
+# renders the fragments that are new or changed since it was last served.
+#
+#     {{ cached_fragment("partials/dish_card.html",
+#                        ("dish_card", dish.id, dish.version), dish=dish) }}
+#
+# The key must capture everything the partial depends on besides the
+# template itself; a deploy restarts the process and so empties the cache.
+
+
+class FragmentCache:
+    def __init__(self, max_entries=4096, max_bytes=16 * 1024 * 1024):
+        # Per process, like the response cache: entries never go stale
+        self.backend = MemoryBackend(max_entries=max_entries, max_bytes=max_bytes)
+        self.entries = Cache(self.backend, name="fragments")
+
+    def init_app(self, app):
+        lru = self.backend.entries
+        lru.max_entries = app.config.get("FRAGMENT_CACHE_MAX_ENTRIES", lru.max_entries)
+        lru.max_bytes = app.config.get("FRAGMENT_CACHE_MAX_BYTES", lru.max_bytes)
+        app.jinja_env.globals["cached_fragment"] = self.render
+        app.extensions["fragment_cache"] = self
+
+    def render(self, template_name, key, **context):
+        """The rendered partial for `key`, rendering it on a miss"""
+        key = (template_name, key)
+        html = self.entries.get(key)
+        if html is None:
+            html = Markup(render_template(template_name, **context))
+            self.entries.set(key, html)
+        return html
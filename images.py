@@ -0,0 +1,286 @@
+import hashlib
+import io
+import os
+
+from flask import current_app
+
+from models import db, Dish
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:  # optional: only needed to build variants
+    Image = None
+
+# Responsive dish images
+#
+# Dish images are full-size uploads, some several MB of PNG, but the card
+# grid shows them 200px high. build_variants() scales an image down to the
+# widths of each LAYOUTS entry (never up), cropping it to the card's shape
+# for the grid, and encodes every width in each of the configured
+# IMAGE_FORMATS. Files are named after their content hash, e.g.
+# images/variants/chicken_curry-card-400w.3f9c1a2b7d.webp, so a URL always
+# means the same bytes and a re-encoded image never collides with a cached
+# one.
+#
+# The URLs are stored in Dish.image_variants, and responsive_image() turns
+# them into the srcset/<source> lists the templates render. Variants are
+# built
+#
+#   - by upgrade_schema(), the first time it adds the column
+#   - for imported dishes, at the end of an import (importer.finish_import)
+#   - on upload: set dish.image, then call update_dish_images([dish])
+#   - offline, with `flask build-images` (--force re-encodes everything)
+#
+# A dish without variants (no Pillow, a remote or missing source file)
+# keeps rendering its original dish.image.
+VARIANTS_DIR = "images/variants"  # under the static folder
+
+# Per layout: the widths to build (1x and 2x), the aspect ratio to crop to
+# (None keeps the whole image), the rendered width at each Bootstrap grid
+# breakpoint for `sizes`, and the width <img src> falls back to
+LAYOUTS = {
+    # 200px high, at most ~350px wide, with object-fit: cover
+    "card": {
+        "widths": (400, 800),
+        "aspect": 7 / 4,
+        "sizes": "(min-width: 1200px) 350px, (min-width: 992px) 290px, "
+        "(min-width: 768px) 210px, (min-width: 576px) 240px, 100vw",
+        "fallback": 400,
+    },
+    "detail": {
+        "widths": (800, 1600),
+        "aspect": None,
+        "sizes": "(min-width: 1200px) 465px, (min-width: 992px) 390px, "
+        "(min-width: 768px) 690px, (min-width: 576px) 510px, 100vw",
+        "fallback": 800,
+    },
+}
+
+# Encoders, best compression first; <img> itself always gets the JPEG
+ENCODERS = {
+    "avif": ("AVIF", "image/avif", {"quality": 55, "speed": 6}),
+    "webp": ("WEBP", "image/webp", {"quality": 80, "method": 4}),
+    "jpeg": (
+        "JPEG",
+        "image/jpeg",
+        {"quality": 82, "optimize": True, "progressive": True},
+    ),
+}
+FALLBACK_FORMAT = "jpeg"
+# 2x variants are shown at half their size, where stronger compression
+# doesn't show; this is most of the savings on high-density screens
+HIDPI_QUALITY = {"avif": 40, "webp": 60, "jpeg": 70}
+# AVIF is 30-40% smaller than WebP but several times slower to encode
+DEFAULT_FORMATS = "webp,jpeg"
+
+HASH_LENGTH = 10
+
+
+def available():
+    return Image is not None
+
+
+def parse_formats(value):
+    """Known, supported formats from a "webp,jpeg" string, JPEG always last"""
+    formats = []
+    for name in (value or DEFAULT_FORMATS).lower().split(","):
+        name = name.strip()
+        if name in ENCODERS and name != FALLBACK_FORMAT and name not in formats:
+            if name == "avif" and not features.check("avif"):
+                continue
+            formats.append(name)
+    return formats + [FALLBACK_FORMAT]
+
+
+def configure(app):
+    """IMAGE_FORMATS config and the responsive_image() template global"""
+    app.config.setdefault("IMAGE_FORMATS", os.getenv("IMAGE_FORMATS", DEFAULT_FORMATS))
+    app.jinja_env.globals["responsive_image"] = responsive_image
+
+
+def file_digest(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def static_path(url):
+    """Filesystem path of a URL under the static folder, or None"""
+    prefix = current_app.static_url_path.rstrip("/") + "/"
+    if not url or not url.startswith(prefix):
+        return None
+    relative = os.path.normpath(url[len(prefix) :])
+    if relative.startswith(("..", "/")):
+        return None
+    return os.path.join(current_app.static_folder, relative)
+
+
+def _resize(image, width, aspect):
+    """`image` scaled to `width` (at most its own), center-cropped to `aspect`"""
+    if aspect is None:
+        if width >= image.width:
+            return image
+        return image.resize(
+            (width, max(1, round(image.height * width / image.width))),
+            Image.LANCZOS,
+        )
+    # Never upscale: the widest crop of the source at this aspect ratio
+    width = min(width, image.width, round(image.height * aspect))
+    size = (width, max(1, round(width / aspect)))
+    return ImageOps.fit(image, size, Image.LANCZOS)
+
+
+def _encode(image, format, hidpi=False):
+    name, _, options = ENCODERS[format]
+    if hidpi:
+        options = dict(options, quality=HIDPI_QUALITY[format])
+    buffer = io.BytesIO()
+    image.save(buffer, name, **options)
+    return buffer.getvalue()
+
+
+def build_variants(source, output_dir, url_prefix, formats, digest=None):
+    """
+    Write the resized, re-encoded variants of the image file `source` into
+    `output_dir` and return their metadata (what Dish.image_variants holds)
+    """
+    digest = digest or file_digest(source)
+    stem = os.path.splitext(os.path.basename(source))[0]
+    with Image.open(source) as original:
+        original.load()
+        if original.mode not in ("RGB", "L"):
+            # JPEG has no alpha channel; flatten onto white
+            flat = Image.new("RGB", original.size, "white")
+            flat.paste(original, mask=original.convert("RGBA").getchannel("A"))
+            original = flat
+        os.makedirs(output_dir, exist_ok=True)
+        variants = {"source": digest}
+        for layout, spec in LAYOUTS.items():
+            files = variants[layout] = {format: [] for format in formats}
+            built = set()
+            for index, width in enumerate(spec["widths"]):
+                resized = _resize(original, width, spec["aspect"])
+                if resized.width in built:
+                    continue  # the source is narrower than `width`
+                built.add(resized.width)
+                for format in formats:
+                    data = _encode(resized, format, hidpi=index > 0)
+                    content_hash = hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+                    filename = (
+                        f"{stem}-{layout}-{resized.width}w.{content_hash}.{format}"
+                    )
+                    path = os.path.join(output_dir, filename)
+                    if not os.path.exists(path):
+                        with open(path, "wb") as f:
+                            f.write(data)
+                    files[format].append([resized.width, f"{url_prefix}/{filename}"])
+    return variants
+
+
+def _is_current(variants, digest, formats):
+    """Whether stored variants were built from this source, in these formats"""
+    if not variants or variants.get("source") != digest:
+        return False
+    if any(
+        format not in variants.get(layout, {})
+        for layout in LAYOUTS
+        for format in formats
+    ):
+        return False
+    return all(
+        os.path.exists(static_path(url) or "")
+        for layout in LAYOUTS
+        for format in formats
+        for _, url in variants[layout][format]
+    )
+
+
+def update_dish_images(dishes, force=False):
+    """
+    (Re)build the variants of dishes whose image changed since they were
+    last built; returns how many dishes got new variants. The caller
+    commits; image_variants goes through the ORM, so the dishes' versions
+    and cached cards move with it.
+    """
+    formats = parse_formats(current_app.config.get("IMAGE_FORMATS"))
+    output_dir = os.path.join(current_app.static_folder, VARIANTS_DIR)
+    url_prefix = f"{current_app.static_url_path}/{VARIANTS_DIR}"
+    updated = 0
+    for dish in dishes:
+        source = static_path(dish.image)
+        if source is None or not os.path.isfile(source):
+            continue
+        digest = file_digest(source)
+        if not force and _is_current(dish.image_variants, digest, formats):
+            continue
+        dish.image_variants = build_variants(
+            source, output_dir, url_prefix, formats, digest=digest
+        )
+        updated += 1
+    return updated
+
+
+def build_all(force=False, prune=True, batch_size=50):
+    """
+    Bring every dish's variants up to date, committing per batch; with
+    `prune`, delete variant files no dish refers to any more. Returns
+    (dishes updated, files deleted).
+    """
+    dish_ids = db.session.scalars(db.select(Dish.id).order_by(Dish.id)).all()
+    updated = 0
+    for start in range(0, len(dish_ids), batch_size):
+        batch = dish_ids[start : start + batch_size]
+        dishes = db.session.scalars(db.select(Dish).where(Dish.id.in_(batch))).all()
+        updated += update_dish_images(dishes, force=force)
+        db.session.commit()
+    return updated, prune_variants() if prune else 0
+
+
+def prune_variants():
+    """Delete files in the variants directory that no dish refers to"""
+    output_dir = os.path.join(current_app.static_folder, VARIANTS_DIR)
+    if not os.path.isdir(output_dir):
+        return 0
+    referenced = set()
+    for (variants,) in db.session.execute(
+        db.select(Dish.image_variants).where(Dish.image_variants.is_not(None))
+    ):
+        for files in (variants.get(layout, {}) for layout in LAYOUTS):
+            for urls in files.values():
+                referenced.update(os.path.basename(url) for _, url in urls)
+    deleted = 0
+    for filename in os.listdir(output_dir):
+        if filename not in referenced:
+            os.remove(os.path.join(output_dir, filename))
+            deleted += 1
+    return deleted
+
+
+# Templates
+def responsive_image(image, variants, layout):
+    """
+    src, srcset and sizes for an <img> in `layout` ("card" or "detail"),
+    plus (type, srcset) pairs for the <source> elements of a <picture>
+    """
+    files = (variants or {}).get(layout) or {}
+    if not files.get(FALLBACK_FORMAT):
+        return {"src": image, "srcset": None, "sizes": None, "sources": []}
+
+    def srcset(format):
+        return ", ".join(f"{url} {width}w" for width, url in files[format])
+
+    spec = LAYOUTS[layout]
+    fallback = files[FALLBACK_FORMAT]
+    src = next(
+        (url for width, url in fallback if width >= spec["fallback"]),
+        fallback[-1][1],
+    )
+    return {
+        "src": src,
+        "srcset": srcset(FALLBACK_FORMAT),
+        "sizes": spec["sizes"],
+        "sources": [
+            (ENCODERS[format][1], srcset(format))
+            for format in ENCODERS
+            if format != FALLBACK_FORMAT and files.get(format)
+        ],
+    }
@@ -0,0 +1,346 @@
+import json
+import os
+import time
+from datetime import date, datetime
+from itertools import islice
+
+import images
+import search as search_index
+from models import (
+    db,
+    Dish,
+    DishTag,
+    Review,
+    Tag,
+    User,
+    rebuild_stats_rollups,
+)
+from passwords import PasswordHasher
+
+# Bulk JSON importer
+#
+# Existing keys (usernames, dish ids, tag names) are loaded once into dicts
+# and sets, new rows go in as executemany INSERTs of IMPORT_BATCH_SIZE rows,
+# and each batch is committed on its own. Derived data (rating aggregates,
+# dashboard rollups, the search index) is recomputed once at the end with
+# set-based statements instead of being maintained row by row.
+IMPORT_BATCH_SIZE = 5000
+DISH_BATCH_SIZE = 500
+
+
+READ_CHUNK_SIZE = 64 * 1024
+JSON_LINES_EXTENSIONS = (".jsonl", ".ndjson")
+_VALUE_ENDS = {",", "]", " ", "\t", "\n", "\r"}
+
+
+# Streaming input
+#
+# Records are decoded one at a time so peak memory is one batch of records,
+# not the whole document. A file is read as a top-level JSON array, or as
+# JSON Lines (one record per line) when it has a .jsonl/.ndjson extension
+# or doesn't start with "[".
+def iter_json_array(f, chunk_size=READ_CHUNK_SIZE):
+    """Yield the elements of the top-level JSON array in file `f`"""
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pos = 0
+    eof = False
+
+    def read_more(size):
+        nonlocal buffer, pos, eof
+        chunk = f.read(size)
+        eof = not chunk
+        buffer = buffer[pos:] + chunk
+        pos = 0
+
+    def skip_whitespace():
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos].isspace():
+                pos += 1
+            if pos < len(buffer) or eof:
+                return
+            read_more(chunk_size)
+
+    skip_whitespace()
+    if buffer[pos : pos + 1] != "[":
+        raise ValueError("Expected a JSON array")
+    pos += 1
+    skip_whitespace()
+    if buffer[pos : pos + 1] == "]":
+        return
+    while True:
+        # A number cut off by the end of the buffer still decodes ("-1" of
+        # "-1.5"), so a value only counts once the character after it is
+        # one that can end an array element. Reads grow with the buffer to
+        # keep huge values linear.
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                end = None
+            if end is not None and (eof or buffer[end : end + 1] in _VALUE_ENDS):
+                break
+            read_more(max(chunk_size, len(buffer) - pos))
+        pos = end
+        yield value
+
+        skip_whitespace()
+        separator = buffer[pos : pos + 1]
+        if separator == "]":
+            return
+        if separator != ",":
+            raise ValueError(f"Expected ',' or ']' in JSON array, got {separator!r}")
+        pos += 1
+        skip_whitespace()
+
+
+def iter_json_lines(f):
+    """Yield one record per non-blank line"""
+    for line_number, line in enumerate(f, 1):
+        line = line.strip()
+        if line:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"Invalid JSON on line {line_number}: {e}") from e
+
+
+def iter_json_records(path):
+    """Stream the records of a JSON array or JSON Lines file"""
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(JSON_LINES_EXTENSIONS):
+            yield from iter_json_lines(f)
+            return
+        head = f.read(READ_CHUNK_SIZE).lstrip()
+        f.seek(0)
+        if head.startswith("["):
+            yield from iter_json_array(f)
+        else:
+            yield from iter_json_lines(f)
+
+
+def find_data_file(directory, name):
+    """Path of `name`.json or `name`.jsonl/.ndjson in directory, if any"""
+    for extension in (".json",) + JSON_LINES_EXTENSIONS:
+        path = os.path.join(directory, name + extension)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class ImportProgress:
+    """Row counters and throughput for one import phase"""
+
+    def __init__(self, label):
+        self.label = label
+        self.read = 0
+        self.inserted = 0
+        self.skipped = 0
+        self.started = time.perf_counter()
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def report(self):
+        elapsed = self.elapsed
+        rate = self.read / elapsed if elapsed > 0 else 0.0
+        message = (
+            f"{self.label}: {self.inserted} inserted, {self.read} read "
+            f"in {elapsed:.2f}s ({rate:,.0f} rows/sec)"
+        )
+        if self.skipped:
+            message += f", {self.skipped} skipped"
+        print(message)
+
+
+def _ids_by(column, key_column, values):
+    """{key: id} for the rows whose key_column is in `values`"""
+    if not values:
+        return {}
+    return dict(db.session.query(key_column, column).filter(key_column.in_(values)))
+
+
+def import_users(records, batch_size=IMPORT_BATCH_SIZE, workers=None):
+    """
+    Insert users that don't exist yet; returns {username: user id}.
+    Passwords are hashed across `workers` processes (see passwords.py).
+    """
+    progress = ImportProgress("Users")
+    user_ids = dict(db.session.query(User.username, User.id))
+    with PasswordHasher(workers) as hasher:
+        for batch in batched(records, batch_size):
+            progress.read += len(batch)
+            new_users = []
+            for record in batch:
+                username = record["username"]
+                if username in user_ids:
+                    continue
+                user_ids[username] = None  # claimed; the real id is fetched below
+                new_users.append((username, record["password"]))
+            if new_users:
+                hashes = hasher.hash_many(password for _, password in new_users)
+                rows = [
+                    {"username": username, "password_hash": password_hash}
+                    for (username, _), password_hash in zip(new_users, hashes)
+                ]
+                db.session.execute(User.__table__.insert(), rows)
+                user_ids.update(
+                    _ids_by(User.id, User.username, [row["username"] for row in rows])
+                )
+                progress.inserted += len(rows)
+            db.session.commit()
+    progress.report()
+    return user_ids
+
+
+def _dish_row(record):
+    # Encoded by the columns' JSONText type
+    return {
+        "id": record["id"],
+        "name": record["name"],
+        "description": record.get("description", ""),
+        "image": record.get("image", ""),
+        "avg_rating": record.get("avg_rating", 0.0),
+        "ingredients": record.get("ingredients") or None,
+        "preparation": record.get("preparation") or None,
+    }
+
+
+def _insert_dish_tags(dish_tags, tag_ids):
+    """Insert DishTag rows for {dish_id: [tag names]}, creating missing tags"""
+    names = {name for tags in dish_tags.values() for name in tags}
+    missing = sorted(names - tag_ids.keys())
+    if missing:
+        db.session.execute(Tag.__table__.insert(), [{"name": n} for n in missing])
+        tag_ids.update(_ids_by(Tag.id, Tag.name, missing))
+    rows = [
+        {"dish_id": dish_id, "tag_id": tag_ids[name], "position": position}
+        for dish_id, tags in dish_tags.items()
+        for position, name in enumerate(tags)
+    ]
+    if rows:
+        db.session.execute(DishTag.__table__.insert(), rows)
+
+
+def _parse_date(value):
+    try:
+        return date.fromisoformat(value)  # much faster than strptime
+    except ValueError:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+def _review_row(record, dish_id, user_id):
+    comment = record["comment"]
+    return {
+        "dish_id": dish_id,
+        "user_id": user_id,
+        "rating": int(float(record["rating"])),  # Handle float ratings
+        "comment": comment,
+        "comment_length": len(comment or ""),
+        "date": _parse_date(record["date"]),
+    }
+
+
+def _insert_reviews(rows, progress):
+    """Insert review rows, skipping (dish, user) pairs that already exist"""
+    dish_ids = {row["dish_id"] for row in rows}
+    seen = set(
+        db.session.query(Review.dish_id, Review.user_id).filter(
+            Review.dish_id.in_(dish_ids)
+        )
+    )
+    new_rows = []
+    for row in rows:
+        pair = (row["dish_id"], row["user_id"])
+        if pair not in seen:
+            seen.add(pair)
+            new_rows.append(row)
+    if new_rows:
+        db.session.execute(Review.__table__.insert(), new_rows)
+    progress.inserted += len(new_rows)
+    progress.skipped += len(rows) - len(new_rows)
+    db.session.commit()
+
+
+def import_dishes(records, user_ids, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Insert new dishes (with their tags) and their reviews. Reviews are
+    either embedded in the dish record ("reviews") or, in JSON Lines input,
+    separate records carrying a "dish_id".
+    """
+    dish_progress = ImportProgress("Dishes")
+    review_progress = ImportProgress("Reviews")
+    dish_ids = set(db.session.scalars(db.select(Dish.id)))
+    tag_ids = dict(db.session.query(Tag.name, Tag.id))
+    pending_reviews = []
+
+    def add_review(review, dish_id):
+        nonlocal pending_reviews
+        review_progress.read += 1
+        user_id = user_ids.get(review["user"])
+        if user_id is None or dish_id not in dish_ids:
+            review_progress.skipped += 1
+            return
+        pending_reviews.append(_review_row(review, dish_id, user_id))
+        if len(pending_reviews) >= batch_size:
+            _insert_reviews(pending_reviews, review_progress)
+            pending_reviews = []
+
+    for batch in batched(records, DISH_BATCH_SIZE):
+        rows = []
+        dish_tags = {}
+        for record in batch:
+            if "dish_id" in record:
+                continue
+            dish_progress.read += 1
+            if record["id"] in dish_ids:
+                continue
+            dish_ids.add(record["id"])
+            rows.append(_dish_row(record))
+            tags = list(dict.fromkeys(t for t in record.get("tags") or [] if t))
+            if tags:
+                dish_tags[record["id"]] = tags
+        if rows:
+            db.session.execute(Dish.__table__.insert(), rows)
+            _insert_dish_tags(dish_tags, tag_ids)
+            dish_progress.inserted += len(rows)
+            db.session.commit()
+
+        for record in batch:
+            if "dish_id" in record:
+                add_review(record, record["dish_id"])
+                continue
+            for review in record.get("reviews") or []:
+                add_review(review, record["id"])
+
+    if pending_reviews:
+        _insert_reviews(pending_reviews, review_progress)
+    dish_progress.report()
+    review_progress.report()
+    return dish_progress.inserted + review_progress.inserted
+
+
+def finish_import():
+    """Recompute everything derived from dishes and reviews in bulk"""
+    started = time.perf_counter()
+    Dish.recompute_rating_aggregates()
+    rebuild_stats_rollups()
+    db.session.commit()
+    search_index.ensure_search_index(rebuild=True)
+    elapsed = time.perf_counter() - started
+    print(f"Rebuilt aggregates, rollups and search index in {elapsed:.2f}s")
+    if images.available():
+        started = time.perf_counter()
+        updated, _ = images.build_all(prune=False)
+        elapsed = time.perf_counter() - started
+        print(f"Built image variants for {updated} dishes in {elapsed:.2f}s")
@@ -0,0 +1,168 @@
+import argparse
+import http.client
+import itertools
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from app import app
+from models import User
+
+# Load test: the Flask dev server (threaded) against the ASGI API (uvicorn)
+#
+#     python loadtest.py --concurrency 32 --duration 10
+#
+# Starts both servers on the configured database, signs a session cookie
+# for the first user, and hammers each API endpoint from N client threads
+# with keep-alive connections. --no-cache adds a unique query parameter to
+# every request so the response caches can't answer them.
+ENDPOINTS = [
+    "/api/dishes?limit=24",
+    "/api/dishes/1",
+    "/api/search?q=chicken&limit=24",
+]
+
+SERVERS = {
+    "flask": [
+        sys.executable,
+        "-c",
+        "import sys; from app import app; app.run(port=int(sys.argv[1]), threaded=True)",
+    ],
+    "asgi": [
+        sys.executable,
+        "-m",
+        "uvicorn",
+        "asgi:application",
+        "--log-level",
+        "warning",
+        "--port",
+    ],
+}
+
+
+def session_cookie():
+    with app.app_context():
+        user = User.query.order_by(User.id).first()
+        if user is None:
+            sys.exit("No users in the database; run `flask migrate-json` first")
+        serializer = app.session_interface.get_signing_serializer(app)
+        token = serializer.dumps({"_user_id": str(user.id), "_fresh": True})
+    return f"{app.config['SESSION_COOKIE_NAME']}={token}"
+
+
+def start_server(name, port):
+    process = subprocess.Popen(
+        SERVERS[name] + [str(port)],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    sys.exit(f"{name} server did not start on port {port}")
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    index = min(int(p * len(sorted_values) / 100), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def run(port, path, cookie, concurrency, duration, bust_cache):
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    counter = itertools.count()
+    deadline = time.perf_counter() + duration
+
+    def client():
+        nonlocal errors
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        local = []
+        local_errors = 0
+        while time.perf_counter() < deadline:
+            url = path
+            if bust_cache:
+                url += ("&" if "?" in url else "?") + f"_={next(counter)}"
+            started = time.perf_counter()
+            try:
+                conn.request("GET", url, headers={"Cookie": cookie})
+                response = conn.getresponse()
+                response.read()
+                ok = response.status == 200
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+                ok = False
+            if ok:
+                local.append(time.perf_counter() - started)
+            else:
+                local_errors += 1
+        conn.close()
+        with lock:
+            latencies.extend(local)
+            errors += local_errors
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed,
+        "p50_ms": (percentile(latencies, 50) or 0) * 1000,
+        "p99_ms": (percentile(latencies, 99) or 0) * 1000,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Flask vs ASGI API load test")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds")
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--servers", default="flask,asgi")
+    args = parser.parse_args()
+
+    cookie = session_cookie()
+    results = []
+    for port, name in enumerate(args.servers.split(","), start=8501):
+        process = start_server(name, port)
+        try:
+            for path in ENDPOINTS:
+                stats = run(
+                    port, path, cookie, args.concurrency, args.duration, args.no_cache
+                )
+                results.append((name, path, stats))
+        finally:
+            process.terminate()
+            process.wait()
+
+    print(
+        f"\n{args.concurrency} clients, {args.duration:g}s per endpoint"
+        f"{', response cache bypassed' if args.no_cache else ''}"
+    )
+    print(
+        f"{'server':6} {'endpoint':32} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}"
+    )
+    for name, path, stats in results:
+        print(
+            f"{name:6} {path:32} {stats['rps']:>8.1f} {stats['p50_ms']:>8.1f}"
+            f" {stats['p99_ms']:>8.1f} {stats['errors']:>7}"
+        )
@@ -1,9 +1,58 @@
+from flask import current_app, has_app_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from datetime import datetime
+from sqlalchemy import bindparam, case, cast, event, func, inspect, select, update
+from sqlalchemy.orm import Session, selectinload, validates
 import json
+import math
+import statistics
 
-db = SQLAlchemy()
+from read_routing import RoutingSession
+
+try:
+    import orjson
+except ImportError:  # optional: faster JSON columns
+    orjson = None
+
+db = SQLAlchemy(session_options={"class_": RoutingSession})
+
+# Ratings at or above this count as "positive" (used for Wilson scores)
+POSITIVE_RATING = 4
+
+# Default confidence level for the Wilson score lower bound
+DEFAULT_WILSON_CONFIDENCE = 0.95
+
+
+def wilson_confidence():
+    """The configured Wilson confidence level (app config WILSON_CONFIDENCE)"""
+    if has_app_context():
+        return float(
+            current_app.config.get("WILSON_CONFIDENCE", DEFAULT_WILSON_CONFIDENCE)
+        )
+    return DEFAULT_WILSON_CONFIDENCE
+
+
+def wilson_lower_bound(positive, total, confidence=None):
+    """
+    Lower bound of the Wilson score interval for `positive` out of `total`
+    ratings. This gives a more reliable ranking than simple averages, since
+    dishes with few reviews are pulled down until they've earned the rating.
+    """
+    if not total:
+        return 0.0
+    if confidence is None:
+        confidence = wilson_confidence()
+    z = statistics.NormalDist().inv_cdf(0.5 + confidence / 2)
+    p = positive / total
+
+    denominator = 1 + (z * z) / total
+    numerator = (
+        p
+        + (z * z) / (2 * total)
+        - z * math.sqrt((p * (1 - p) + (z * z) / (4 * total)) / total)
+    )
+    return numerator / denominator
 
 
 class User(UserMixin, db.Model):
@@ -11,7 +60,7 @@ class User(UserMixin, db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False, index=True)
-    password_hash = db.Column(db.String(120), nullable=False)
+    password_hash = db.Column(db.String(255), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     # Relationships
@@ -23,6 +72,30 @@ class User(UserMixin, db.Model):
         return f"<User {self.username}>"
 
 
+def json_loads(text):
+    return orjson.loads(text) if orjson is not None else json.loads(text)
+
+
+def json_dumps(value):
+    return orjson.dumps(value).decode() if orjson is not None else json.dumps(value)
+
+
+class JSONText(db.TypeDecorator):
+    """
+    JSON stored as text (SQLite has no JSON type), decoded once when the row
+    is loaded instead of on every attribute access. Empty values are NULL.
+    """
+
+    impl = db.Text
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return json_dumps(value) if value else None
+
+    def process_result_value(self, value, dialect):
+        return json_loads(value) if value else None
+
+
 class Dish(db.Model):
     __tablename__ = "dishes"
 
@@ -30,55 +103,251 @@ class Dish(db.Model):
     name = db.Column(db.String(200), nullable=False, index=True)
     description = db.Column(db.Text)
     image = db.Column(db.String(200))
+    # URLs of the resized/re-encoded copies of `image` (see images.py)
+    image_variants = db.Column(JSONText)
     avg_rating = db.Column(db.Float, default=0.0)
+
+    # Rating aggregates, maintained incrementally by record_rating()
+    review_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    rating_sum = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    positive_count = db.Column(
+        db.Integer, nullable=False, default=0, server_default="0"
+    )
+    rating_1_count = db.Column(
+        db.Integer, nullable=False, default=0, server_default="0"
+    )
+    rating_2_count = db.Column(
+        db.Integer, nullable=False, default=0, server_default="0"
+    )
+    rating_3_count = db.Column(
+        db.Integer, nullable=False, default=0, server_default="0"
+    )
+    rating_4_count = db.Column(
+        db.Integer, nullable=False, default=0, server_default="0"
+    )
+    rating_5_count = db.Column(
+        db.Integer, nullable=False, default=0, server_default="0"
+    )
+    # Wilson lower bound of positive_count / review_count, kept in step with
+    # the counters so "sort by rating" is an index scan
+    wilson_score = db.Column(db.Float, nullable=False, default=0.0, server_default="0")
+    # Bumped whenever the dish or one of its reviews changes (see
+    # _bump_versions); response caches key on it
+    version = db.Column(db.Integer, nullable=False, default=1, server_default="1")
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(
         db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow
     )
 
-    # Store JSON data as text (SQLite doesn't have native JSON support)
-    _ingredients = db.Column("ingredients", db.Text)
-    _preparation = db.Column("preparation", db.Text)
-    _tags = db.Column("tags", db.Text)
+    # Lists stored as JSON text, decoded at load time
+    _ingredients = db.Column("ingredients", JSONText)
+    _preparation = db.Column("preparation", JSONText)
+
+    # Indexes backing the keyset-paginated sort orders (see DISH_SORTS)
+    __table_args__ = (
+        db.Index("ix_dishes_name_lower", db.func.lower(name), "id"),
+        db.Index("ix_dishes_wilson_score", "wilson_score", "id"),
+        db.Index("ix_dishes_created_at", "created_at", "id"),
+        # Top-k lists on the admin dashboard
+        db.Index("ix_dishes_review_count", "review_count", "id"),
+        db.Index("ix_dishes_avg_rating", "avg_rating", "review_count"),
+    )
 
     # Relationships
     reviews = db.relationship(
         "Review", backref="dish", lazy=True, cascade="all, delete-orphan"
     )
+    # Tags are almost always displayed with the dish, so load them for a whole
+    # result set in one extra query instead of one query per dish
+    tag_links = db.relationship(
+        "DishTag",
+        backref="dish",
+        order_by="DishTag.position",
+        cascade="all, delete-orphan",
+        lazy="selectin",
+    )
 
-    # Properties to handle JSON serialization/deserialization
+    # Lists are replaced, never changed in place, so the setters are the
+    # only writes SQLAlchemy needs to see
     @property
     def ingredients(self):
-        return json.loads(self._ingredients) if self._ingredients else []
+        return self._ingredients or []
 
     @ingredients.setter
     def ingredients(self, value):
-        self._ingredients = json.dumps(value) if value else None
+        self._ingredients = list(value) if value else None
 
     @property
     def preparation(self):
-        return json.loads(self._preparation) if self._preparation else []
+        return self._preparation or []
 
     @preparation.setter
     def preparation(self, value):
-        self._preparation = json.dumps(value) if value else None
+        self._preparation = list(value) if value else None
 
     @property
     def tags(self):
-        return json.loads(self._tags) if self._tags else []
+        # Memoized: templates read dish.tags several times per card. Dropped
+        # whenever tag_links changes or is reloaded (see _forget_tag_names)
+        names = self.__dict__.get("_tag_names")
+        if names is None:
+            names = self._tag_names = [link.tag.name for link in self.tag_links]
+        return names
 
     @tags.setter
     def tags(self, value):
-        self._tags = json.dumps(value) if value else None
+        names = list(dict.fromkeys(name for name in (value or []) if name))
+        existing = {link.tag.name: link for link in self.tag_links}
+        links = []
+        for position, tag in enumerate(Tag.get_or_create_all(names)):
+            link = existing.get(tag.name) or DishTag(tag=tag)
+            link.position = position
+            links.append(link)
+        self.tag_links = links
 
-    def update_avg_rating(self):
-        """Calculate and update the average rating for this dish"""
-        if self.reviews:
-            total_rating = sum(review.rating for review in self.reviews)
-            self.avg_rating = round(total_rating / len(self.reviews), 2)
+    @property
+    def rating_histogram(self):
+        """Number of reviews per star rating, e.g. {1: 0, 2: 3, ...}"""
+        return {stars: getattr(self, f"rating_{stars}_count") for stars in range(1, 6)}
+
+    def record_rating(self, rating, previous=None):
+        """
+        Apply a new review (or an edit from `previous` to `rating`) to the
+        stored aggregates. Counters are updated with SQL expressions so that
+        concurrent reviews can't overwrite each other's increments; call this
+        before committing the review so both land in the same transaction.
+        """
+        cls = type(self)
+        if previous is None:
+            self.review_count = cls.review_count + 1
+            self.rating_sum = cls.rating_sum + rating
+        elif previous != rating:
+            self.rating_sum = cls.rating_sum + (rating - previous)
+        else:
+            return
+
+        positive_delta = int(rating >= POSITIVE_RATING)
+        if previous is not None:
+            positive_delta -= int(previous >= POSITIVE_RATING)
+            column = f"rating_{previous}_count"
+            setattr(self, column, getattr(cls, column) - 1)
+        if positive_delta:
+            self.positive_count = cls.positive_count + positive_delta
+        column = f"rating_{rating}_count"
+        setattr(self, column, getattr(cls, column) + 1)
+
+        # The counters' flush bumps the version; the summary's doesn't (see
+        # RATING_SUMMARY_COLUMNS)
+        db.session.flush()
+        self.refresh_rating_summary()
+
+    def refresh_rating_summary(self):
+        """
+        Recompute the derived average and Wilson score from the counters;
+        call it only after updating them, in the same transaction
+        """
+        if self.review_count:
+            self.avg_rating = round(self.rating_sum / self.review_count, 2)
         else:
             self.avg_rating = 0.0
+        self.wilson_score = wilson_lower_bound(self.positive_count, self.review_count)
+
+    @classmethod
+    def recompute_wilson_scores(cls, confidence=None, batch_size=1000, dish_ids=None):
+        """
+        Recompute the Wilson scores of every dish (e.g. after a confidence
+        change) or only of the given ids; only those dishes' versions and
+        documents change
+        """
+        if confidence is None:
+            confidence = wilson_confidence()
+        query = select(cls.id, cls.positive_count, cls.review_count)
+        if dish_ids is not None:
+            dish_ids = list(dish_ids)
+            query = query.where(cls.id.in_(dish_ids))
+        rows = db.session.execute(query).all()
+        stmt = (
+            cls.__table__.update()
+            .where(cls.__table__.c.id == bindparam("dish_id"))
+            .values(
+                wilson_score=bindparam("score"),
+                version=cls.__table__.c.version + 1,
+            )
+        )
+        for start in range(0, len(rows), batch_size):
+            db.session.execute(
+                stmt,
+                [
+                    {
+                        "dish_id": dish_id,
+                        "score": wilson_lower_bound(positive, total, confidence),
+                    }
+                    for dish_id, positive, total in rows[start : start + batch_size]
+                ],
+            )
+        if dish_ids is None:
+            AppSetting.set("wilson_confidence", repr(confidence))
+        bump_catalog_version()
+        refresh_dish_documents(dish_ids)
+
+    @classmethod
+    def recompute_rating_aggregates(cls, dish_ids=None):
+        """
+        Recount the stored rating aggregates from the reviews table in two
+        set-based UPDATEs (for all dishes, or only the given ids)
+        """
+        totals = select(
+            Review.dish_id,
+            func.count(Review.id).label("review_count"),
+            func.sum(Review.rating).label("rating_sum"),
+            func.sum(case((Review.rating >= POSITIVE_RATING, 1), else_=0)).label(
+                "positive_count"
+            ),
+            *[
+                func.sum(case((Review.rating == stars, 1), else_=0)).label(
+                    f"rating_{stars}_count"
+                )
+                for stars in range(1, 6)
+            ],
+        ).group_by(Review.dish_id)
+        reset = update(cls).values(
+            version=cls.version + 1,
+            avg_rating=0.0,
+            review_count=0,
+            rating_sum=0,
+            positive_count=0,
+            **{f"rating_{stars}_count": 0 for stars in range(1, 6)},
+        )
+        if dish_ids is not None:
+            totals = totals.where(Review.dish_id.in_(dish_ids))
+            reset = reset.where(cls.id.in_(dish_ids))
+        totals = totals.subquery()
+
+        counters = ["review_count", "rating_sum", "positive_count"] + [
+            f"rating_{stars}_count" for stars in range(1, 6)
+        ]
+        recount = (
+            update(cls)
+            .where(cls.id == totals.c.dish_id)
+            .values(
+                avg_rating=func.round(
+                    totals.c.rating_sum * 1.0 / totals.c.review_count, 2
+                ),
+                **{name: totals.c[name] for name in counters},
+            )
+        )
+        options = {"synchronize_session": False}
+        db.session.execute(reset, execution_options=options)
+        db.session.execute(recount, execution_options=options)
+        # Also bumps the catalog version and rewrites the dishes' documents
+        cls.recompute_wilson_scores(dish_ids=dish_ids)
+
+    def update_avg_rating(self):
+        """Recount this dish's rating aggregates from its reviews"""
+        db.session.flush()
+        type(self).recompute_rating_aggregates(dish_ids=[self.id])
         db.session.commit()
+        db.session.refresh(self)
 
     def to_dict(self):
         """Convert dish to dictionary (for JSON responses)"""
@@ -91,6 +360,9 @@ class Dish(db.Model):
             "preparation": self.preparation,
             "tags": self.tags,
             "avg_rating": self.avg_rating,
+            "wilson_score": self.wilson_score,
+            "review_count": self.review_count,
+            "rating_histogram": self.rating_histogram,
             "reviews": [review.to_dict() for review in self.reviews],
         }
 
@@ -98,6 +370,61 @@ class Dish(db.Model):
         return f"<Dish {self.name}>"
 
 
+class Tag(db.Model):
+    __tablename__ = "tags"
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(80), unique=True, nullable=False, index=True)
+
+    __table_args__ = (db.Index("ix_tags_name_lower", db.func.lower(name)),)
+
+    @classmethod
+    def get_or_create_all(cls, names):
+        """Return Tag rows for the given names (in order), creating missing ones"""
+        if not names:
+            return []
+        with db.session.no_autoflush:
+            # Tags created earlier in this transaction aren't flushed yet
+            found = {obj.name: obj for obj in db.session.new if isinstance(obj, cls)}
+            found.update(
+                (tag.name, tag) for tag in cls.query.filter(cls.name.in_(names))
+            )
+            for name in names:
+                if name not in found:
+                    found[name] = cls(name=name)
+                    db.session.add(found[name])
+        return [found[name] for name in names]
+
+    def __repr__(self):
+        return f"<Tag {self.name}>"
+
+
+class DishTag(db.Model):
+    """Association between a dish and its tags, keeping the display order"""
+
+    __tablename__ = "dish_tags"
+
+    dish_id = db.Column(db.Integer, db.ForeignKey("dishes.id"), primary_key=True)
+    tag_id = db.Column(db.Integer, db.ForeignKey("tags.id"), primary_key=True)
+    position = db.Column(db.Integer, nullable=False, default=0)
+
+    tag = db.relationship("Tag", lazy="joined")
+
+    # The primary key covers dish -> tags; this one covers tag -> dishes
+    __table_args__ = (db.Index("ix_dish_tags_tag_id", "tag_id", "dish_id"),)
+
+
+@event.listens_for(Dish.tag_links, "append")
+@event.listens_for(Dish.tag_links, "remove")
+@event.listens_for(Dish.tag_links, "bulk_replace")
+@event.listens_for(Dish, "refresh")
+@event.listens_for(Dish, "expire")
+def _forget_tag_names(dish, *args):
+    """Drop the memoized Dish.tags"""
+    if dish is not None:  # expired instances may already be collected
+        dish.__dict__.pop("_tag_names", None)
+
+
 class Review(db.Model):
     __tablename__ = "reviews"
 
@@ -110,8 +437,13 @@ class Review(db.Model):
     )
     rating = db.Column(db.Integer, nullable=False)
     comment = db.Column(db.Text, nullable=False)
+    # len(comment), kept in step by _set_comment_length() so length stats
+    # never need to read the comment text
+    comment_length = db.Column(
+        db.Integer, nullable=False, default=0, server_default="0", index=True
+    )
     date = db.Column(db.Date, default=datetime.utcnow().date)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
 
     # Constraints
     __table_args__ = (
@@ -119,6 +451,11 @@ class Review(db.Model):
         db.UniqueConstraint("dish_id", "user_id", name="unique_user_dish_review"),
     )
 
+    @validates("comment")
+    def _set_comment_length(self, key, comment):
+        self.comment_length = len(comment or "")
+        return comment
+
     def to_dict(self):
         """Convert review to dictionary"""
         return {
@@ -134,6 +471,435 @@ class Review(db.Model):
         return f"<Review {self.rating}* by {self.author.username} for {self.dish.name}>"
 
 
+class AppSetting(db.Model):
+    """Small key/value store for settings the data itself depends on"""
+
+    __tablename__ = "app_settings"
+
+    key = db.Column(db.String(80), primary_key=True)
+    value = db.Column(db.Text)
+
+    @classmethod
+    def get(cls, key, default=None):
+        setting = db.session.get(cls, key)
+        return setting.value if setting is not None else default
+
+    @classmethod
+    def set(cls, key, value):
+        setting = db.session.get(cls, key)
+        if setting is None:
+            db.session.add(cls(key=key, value=value))
+        else:
+            setting.value = value
+
+
+CATALOG_VERSION_KEY = "catalog_version"
+
+
+def catalog_version():
+    """Global counter bumped by every dish or review write"""
+    value = db.session.scalar(
+        select(AppSetting.value).where(AppSetting.key == CATALOG_VERSION_KEY)
+    )
+    return int(value) if value is not None else 0
+
+
+def bump_catalog_version(connection=None):
+    """Invalidate everything keyed on catalog_version()"""
+    connection = connection if connection is not None else db.session.connection()
+    table = AppSetting.__table__
+    bumped = connection.execute(
+        table.update()
+        .where(table.c.key == CATALOG_VERSION_KEY)
+        .values(value=cast(cast(table.c.value, db.Integer) + 1, db.Text))
+    )
+    if not bumped.rowcount:
+        connection.execute(table.insert().values(key=CATALOG_VERSION_KEY, value="1"))
+
+
+# Derived from the rating counters by Dish.refresh_rating_summary(), which
+# runs after the counters were flushed in the same transaction; that flush
+# already bumped the dish's version, so a flush of only these doesn't again
+RATING_SUMMARY_COLUMNS = frozenset({"avg_rating", "wilson_score"})
+
+
+def _modified_columns(obj):
+    state = inspect(obj)
+    return {
+        key for key in state.committed_state if state.attrs[key].history.has_changes()
+    }
+
+
+@event.listens_for(Session, "before_flush")
+def _bump_versions(session, flush_context, instances):
+    """Bump Dish.version for dishes whose row or reviews are being written"""
+    changed = set()
+    catalog_changed = False
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Dish):
+            if obj in session.dirty and session.is_modified(obj):
+                if _modified_columns(obj) <= RATING_SUMMARY_COLUMNS:
+                    continue
+                changed.add(obj)
+            catalog_changed = True
+        elif isinstance(obj, Review):
+            if obj in session.dirty and not session.is_modified(obj):
+                continue
+            catalog_changed = True
+            dish = obj.dish or (obj.dish_id and session.get(Dish, obj.dish_id))
+            if dish is not None and dish not in session.new:
+                changed.add(dish)
+
+    for dish in changed:
+        if dish not in session.deleted:
+            dish.version = Dish.version + 1
+    if catalog_changed:
+        session.info["catalog_changed"] = True
+
+    # Their stored JSON documents are rewritten at commit
+    documents = session.info.setdefault("document_dishes", set())
+    documents.update(changed)
+    documents.update(
+        obj
+        for obj in list(session.new) + list(session.deleted)
+        if isinstance(obj, Dish)
+    )
+
+
+@event.listens_for(Session, "after_flush")
+def _bump_catalog_version(session, flush_context):
+    if session.info.pop("catalog_changed", False):
+        bump_catalog_version(session.connection())
+
+
+# Pre-serialized dish documents
+#
+# The JSON API serves each dish as Dish.to_dict() ("full") or the same without
+# its reviews ("card"). Both are serialized when the dish or one of its
+# reviews is committed and stored with the Dish.version they describe, so a
+# page of dishes is assembled by joining stored strings. A document whose
+# version doesn't match the dish (e.g. written by an older release) is
+# serialized on the spot instead.
+DOCUMENT_VARIANTS = ("full", "card")
+DOCUMENT_BATCH_SIZE = 500
+
+
+class DishDocument(db.Model):
+    __tablename__ = "dish_documents"
+
+    dish_id = db.Column(db.Integer, db.ForeignKey("dishes.id"), primary_key=True)
+    version = db.Column(db.Integer, nullable=False)
+    full = db.Column(db.Text, nullable=False)
+    card = db.Column(db.Text, nullable=False)
+
+
+def dump_document(value):
+    """Compact JSON, byte-for-byte what jsonify() would send for `value`"""
+    if has_app_context():
+        return current_app.json.dumps(value, separators=(",", ":"))
+    return json.dumps(value, separators=(",", ":"), sort_keys=True)
+
+
+def serialize_dish(dish):
+    """DishDocument row values for a dish with its reviews and authors loaded"""
+    document = dish.to_dict()
+    card = {key: value for key, value in document.items() if key != "reviews"}
+    return {
+        "dish_id": dish.id,
+        "version": dish.version,
+        "full": dump_document(document),
+        "card": dump_document(card),
+    }
+
+
+def _load_full_dishes(session, dish_ids):
+    return session.scalars(
+        select(Dish)
+        .where(Dish.id.in_(dish_ids))
+        .options(selectinload(Dish.reviews).joinedload(Review.author))
+        .execution_options(populate_existing=True)
+    ).all()
+
+
+def refresh_dish_documents(dish_ids=None, session=None, batch_size=DOCUMENT_BATCH_SIZE):
+    """Rewrite the stored documents of the given dishes (default: all)"""
+    session = session if session is not None else db.session
+    if dish_ids is None:
+        dish_ids = session.scalars(select(Dish.id)).all()
+    dish_ids = list(dish_ids)
+    table = DishDocument.__table__
+    for start in range(0, len(dish_ids), batch_size):
+        batch = dish_ids[start : start + batch_size]
+        rows = [serialize_dish(dish) for dish in _load_full_dishes(session, batch)]
+        # Deleted dishes lose their documents here too
+        session.execute(table.delete().where(table.c.dish_id.in_(batch)))
+        if rows:
+            session.execute(table.insert(), rows)
+
+
+def dish_documents(dishes, variant="full", session=None):
+    """The `variant` JSON document of each dish, in order"""
+    session = session if session is not None else db.session
+    column = DishDocument.__table__.c[variant]
+    versions = {dish.id: dish.version for dish in dishes}
+    rows = session.execute(
+        select(DishDocument.dish_id, DishDocument.version, column).where(
+            DishDocument.dish_id.in_(versions)
+        )
+    )
+    documents = {
+        dish_id: document
+        for dish_id, version, document in rows
+        if versions[dish_id] == version
+    }
+    missing = [dish_id for dish_id in versions if dish_id not in documents]
+    if missing:
+        for dish in _load_full_dishes(session, missing):
+            documents[dish.id] = serialize_dish(dish)[variant]
+    return [documents[dish.id] for dish in dishes]
+
+
+def document_page(documents, **fields):
+    """
+    JSON for {"dishes": documents, **fields}, joining the stored document
+    strings instead of re-encoding them. Keys are sorted as jsonify() sorts
+    them, with "dishes" ahead of the envelope's other fields.
+    """
+    body = '{"dishes":[' + ",".join(documents) + "]"
+    if fields:
+        body += "," + dump_document(fields)[1:]
+    else:
+        body += "}"
+    return body + "\n"
+
+
+@event.listens_for(Session, "before_commit")
+def _refresh_changed_documents(session):
+    session.flush()
+    while session.info.get("document_dishes"):
+        dishes = session.info.pop("document_dishes")
+        refresh_dish_documents(
+            {dish.id for dish in dishes if dish.id is not None}, session=session
+        )
+        session.flush()
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_changed_documents(session, previous_transaction):
+    session.info.pop("document_dishes", None)
+
+
+def sync_wilson_confidence():
+    """Recompute stored Wilson scores if WILSON_CONFIDENCE has changed"""
+    confidence = wilson_confidence()
+    stored = AppSetting.get("wilson_confidence")
+    if stored is not None and float(stored) == confidence:
+        return False
+    print(f"Recomputing Wilson scores at {confidence:.0%} confidence...")
+    Dish.recompute_wilson_scores(confidence)
+    db.session.commit()
+    return True
+
+
+# Dashboard rollups
+#
+# Pre-aggregated rows for /admin/stats. Every ORM flush that adds, deletes
+# or re-rates a review, or adds or deletes a user or dish, updates them in
+# the same transaction (_record_rollups below), whichever code path wrote
+# it. Bulk Core inserts (the importer) bypass the ORM and call
+# rebuild_stats_rollups() instead, which recomputes them from scratch.
+class DailyDishReviews(db.Model):
+    """Reviews created per dish per day"""
+
+    __tablename__ = "stats_daily_dish_reviews"
+
+    day = db.Column(db.Date, primary_key=True)
+    dish_id = db.Column(db.Integer, db.ForeignKey("dishes.id"), primary_key=True)
+    review_count = db.Column(db.Integer, nullable=False, default=0)
+    rating_sum = db.Column(db.Integer, nullable=False, default=0)
+
+
+class UserReviewStats(db.Model):
+    """Reviews written per user"""
+
+    __tablename__ = "stats_user_reviews"
+
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), primary_key=True)
+    review_count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.Index("ix_stats_user_reviews_review_count", "review_count", "user_id"),
+    )
+
+
+class RatingTotal(db.Model):
+    """Reviews per star rating across the whole catalog"""
+
+    __tablename__ = "stats_rating_totals"
+
+    rating = db.Column(db.Integer, primary_key=True)
+    review_count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class MonthlySignups(db.Model):
+    """New users and dishes per calendar month ("YYYY-MM")"""
+
+    __tablename__ = "stats_monthly_signups"
+
+    kind = db.Column(db.String(10), primary_key=True)  # "users" or "dishes"
+    month = db.Column(db.String(7), primary_key=True)
+    signup_count = db.Column(db.Integer, nullable=False, default=0)
+
+
+ROLLUP_MODELS = (DailyDishReviews, UserReviewStats, RatingTotal, MonthlySignups)
+
+
+def _increment(model, keys, session=None, **deltas):
+    """Add `deltas` to the rollup row identified by `keys`, creating it"""
+    connection = (session if session is not None else db.session).connection()
+    table = model.__table__
+    dialect = connection.dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        stmt = insert(table).values(**keys, **deltas)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(keys),
+            set_={name: table.c[name] + stmt.excluded[name] for name in deltas},
+        )
+        connection.execute(stmt)
+        return
+
+    updated = connection.execute(
+        table.update()
+        .where(*[table.c[name] == value for name, value in keys.items()])
+        .values({name: table.c[name] + delta for name, delta in deltas.items()})
+    )
+    if not updated.rowcount:
+        connection.execute(table.insert().values(**keys, **deltas))
+
+
+def _month_key(column):
+    if db.engine.dialect.name == "sqlite":
+        return func.strftime("%Y-%m", column)
+    return func.to_char(column, "YYYY-MM")
+
+
+def record_review_rollup(review, previous_rating=None, session=None):
+    """Count a new review, or a rating change to an existing one"""
+    day = (review.created_at or datetime.utcnow()).date()
+    keys = {"day": day, "dish_id": review.dish_id}
+    if previous_rating is None:
+        _increment(
+            DailyDishReviews,
+            keys,
+            session,
+            review_count=1,
+            rating_sum=review.rating,
+        )
+        _increment(
+            UserReviewStats, {"user_id": review.user_id}, session, review_count=1
+        )
+    else:
+        if previous_rating == review.rating:
+            return
+        _increment(
+            DailyDishReviews,
+            keys,
+            session,
+            rating_sum=review.rating - previous_rating,
+        )
+        _increment(RatingTotal, {"rating": previous_rating}, session, review_count=-1)
+    _increment(RatingTotal, {"rating": review.rating}, session, review_count=1)
+
+
+def record_review_removal(review, rating, session=None):
+    """Uncount a deleted review that had `rating` when it was stored"""
+    day = (review.created_at or datetime.utcnow()).date()
+    keys = {"day": day, "dish_id": review.dish_id}
+    _increment(DailyDishReviews, keys, session, review_count=-1, rating_sum=-rating)
+    _increment(UserReviewStats, {"user_id": review.user_id}, session, review_count=-1)
+    _increment(RatingTotal, {"rating": rating}, session, review_count=-1)
+
+
+def record_signup(kind, created_at=None, session=None, count=1):
+    """Count a new user or dish in its signup month (or uncount, count=-1)"""
+    month = (created_at or datetime.utcnow()).strftime("%Y-%m")
+    _increment(
+        MonthlySignups, {"kind": kind, "month": month}, session, signup_count=count
+    )
+
+
+def _stored_rating(review):
+    """A review's rating as the database has it before this flush"""
+    from sqlalchemy import inspect
+
+    history = inspect(review).attrs.rating.history
+    return (history.deleted or history.unchanged or [review.rating])[0]
+
+
+@event.listens_for(Session, "after_flush")
+def _record_rollups(session, flush_context):
+    # new/dirty/deleted and attribute history still describe the flush here,
+    # and ids and Python-side defaults (created_at) have been filled in
+    signup_kinds = {User: "users", Dish: "dishes"}
+    for obj in session.new:
+        if isinstance(obj, Review):
+            record_review_rollup(obj, session=session)
+        elif type(obj) in signup_kinds:
+            record_signup(signup_kinds[type(obj)], obj.created_at, session)
+    for obj in session.dirty:
+        if isinstance(obj, Review) and obj not in session.deleted:
+            previous = _stored_rating(obj)
+            if previous != obj.rating:
+                record_review_rollup(obj, previous, session)
+    for obj in session.deleted:
+        if isinstance(obj, Review):
+            record_review_removal(obj, _stored_rating(obj), session)
+        elif type(obj) in signup_kinds:
+            record_signup(signup_kinds[type(obj)], obj.created_at, session, count=-1)
+
+
+def rebuild_stats_rollups():
+    """Recompute every rollup table from the source tables"""
+    for model in ROLLUP_MODELS:
+        db.session.execute(model.__table__.delete())
+
+    day = func.date(Review.created_at)
+    db.session.execute(
+        DailyDishReviews.__table__.insert().from_select(
+            ["day", "dish_id", "review_count", "rating_sum"],
+            select(day, Review.dish_id, func.count(Review.id), func.sum(Review.rating))
+            .where(Review.created_at.is_not(None))
+            .group_by(day, Review.dish_id),
+        )
+    )
+    db.session.execute(
+        UserReviewStats.__table__.insert().from_select(
+            ["user_id", "review_count"],
+            select(Review.user_id, func.count(Review.id)).group_by(Review.user_id),
+        )
+    )
+    db.session.execute(
+        RatingTotal.__table__.insert().from_select(
+            ["rating", "review_count"],
+            select(Review.rating, func.count(Review.id)).group_by(Review.rating),
+        )
+    )
+    for kind, model in (("users", User), ("dishes", Dish)):
+        month = _month_key(model.created_at)
+        db.session.execute(
+            MonthlySignups.__table__.insert().from_select(
+                ["kind", "month", "signup_count"],
+                select(db.literal(kind), month, func.count(model.id))
+                .where(model.created_at.is_not(None))
+                .group_by(month),
+            )
+        )
+
+
 # Migration script helper functions
 def create_tables():
     """Create all database tables"""
@@ -141,114 +907,127 @@ def create_tables():
     print("Database tables created successfully!")
 
 
+def _add_missing_columns(table):
+    """Add model columns (and indexes) that an existing table lacks"""
+    from sqlalchemy import inspect, text
+    from sqlalchemy.schema import CreateColumn, CreateIndex
+
+    existing = {column["name"] for column in inspect(db.engine).get_columns(table.name)}
+    added = set()
+    for column in table.columns:
+        if column.name not in existing:
+            ddl = CreateColumn(column).compile(dialect=db.engine.dialect)
+            db.session.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {ddl}"))
+            added.add(column.name)
+    # create_all() only creates indexes together with their table
+    for index in table.indexes:
+        db.session.execute(CreateIndex(index, if_not_exists=True))
+    db.session.commit()
+    return added
+
+
+def upgrade_schema():
+    """Bring an existing database up to date with the current models"""
+    from sqlalchemy import inspect, text
+
+    inspector = inspect(db.engine)
+    dish_columns = {column["name"] for column in inspector.get_columns("dishes")}
+
+    added = _add_missing_columns(Review.__table__)
+    if "comment_length" in added:
+        print("Backfilling review comment lengths...")
+        db.session.execute(
+            update(Review).values(
+                comment_length=func.coalesce(func.length(Review.comment), 0)
+            )
+        )
+        db.session.commit()
+
+    added = _add_missing_columns(Dish.__table__)
+    if "review_count" in added:
+        print("Backfilling dish rating aggregates...")
+        Dish.recompute_rating_aggregates()
+        db.session.commit()
+    if "image_variants" in added:
+        import images
+
+        if images.available():
+            print("Building responsive image variants...")
+            updated, _ = images.build_all()
+            print(f"Built image variants for {updated} dishes")
+        else:
+            print("Pillow is not installed; run `flask build-images` once it is")
+
+    # Tags used to be a JSON list stored in dishes.tags; move them into the
+    # tags/dish_tags tables the first time we see such a database
+    if "tags" in dish_columns and not db.session.query(DishTag.dish_id).first():
+        rows = db.session.execute(
+            text("SELECT id, tags FROM dishes WHERE tags IS NOT NULL")
+        ).all()
+        legacy_tags = {dish_id: json.loads(raw) for dish_id, raw in rows if raw}
+        if legacy_tags:
+            print("Migrating dish tags...")
+            for dish in Dish.query.filter(Dish.id.in_(legacy_tags)):
+                dish.tags = legacy_tags[dish.id]
+            db.session.commit()
+            print(f"Migrated tags for {len(legacy_tags)} dishes")
+
+    # Picks up both a freshly added wilson_score column and config changes
+    sync_wilson_confidence()
+
+    # Fill the dashboard rollups the first time we see existing data
+    if not db.session.query(MonthlySignups.kind).first() and (
+        db.session.query(User.id).first() or db.session.query(Dish.id).first()
+    ):
+        print("Building dashboard rollups...")
+        rebuild_stats_rollups()
+        db.session.commit()
+
+    # ...and the stored dish documents
+    if not db.session.query(DishDocument.dish_id).first() and (
+        db.session.query(Dish.id).first()
+    ):
+        print("Serializing dish documents...")
+        refresh_dish_documents()
+        db.session.commit()
+
+
 def migrate_json_data():
     """Migrate data from JSON files to SQLite database"""
     import os
-    import json
-    from werkzeug.security import generate_password_hash
+    import importer
 
     # Get the base directory
     BASE_DIR = os.path.dirname(__file__)
     DATA_DIR = os.path.join(BASE_DIR, "data")
     USERS_DIR = os.path.join(BASE_DIR, "users")
 
-    # Paths to JSON files
-    DISHES_PATH = os.path.join(DATA_DIR, "dishes.json")
-    USERS_PATH = os.path.join(USERS_DIR, "users.json")
+    # dishes.json / users.json, or their JSON Lines (.jsonl) equivalents;
+    # both are streamed a record at a time
+    DISHES_PATH = importer.find_data_file(DATA_DIR, "dishes")
+    USERS_PATH = importer.find_data_file(USERS_DIR, "users")
 
     print("Starting data migration...")
 
     try:
-        # Migrate Users
-        if os.path.exists(USERS_PATH):
-            print("Migrating users...")
-            with open(USERS_PATH, "r", encoding="utf-8") as f:
-                users_data = json.load(f)
-
-            for user_data in users_data:
-                # Check if user already exists
-                existing_user = User.query.filter_by(
-                    username=user_data["username"]
-                ).first()
-                if not existing_user:
-                    user = User(
-                        username=user_data["username"],
-                        password_hash=generate_password_hash(
-                            user_data["password"]
-                        ),  # Hash the password
-                    )
-                    db.session.add(user)
+        # Existing usernames are needed to attach reviews even when
+        # users.json is absent
+        user_ids = dict(db.session.query(User.username, User.id))
 
-            db.session.commit()
-            print(f"Migrated {len(users_data)} users")
-
-        # Migrate Dishes
-        if os.path.exists(DISHES_PATH):
-            print("Migrating dishes...")
-            with open(DISHES_PATH, "r", encoding="utf-8") as f:
-                dishes_data = json.load(f)
-
-            for dish_data in dishes_data:
-                # Check if dish already exists
-                existing_dish = Dish.query.filter_by(id=dish_data["id"]).first()
-                if not existing_dish:
-                    dish = Dish(
-                        id=dish_data["id"],
-                        name=dish_data["name"],
-                        description=dish_data.get("description", ""),
-                        image=dish_data.get("image", ""),
-                        ingredients=dish_data.get("ingredients", []),
-                        preparation=dish_data.get("preparation", []),
-                        tags=dish_data.get("tags", []),
-                        avg_rating=dish_data.get("avg_rating", 0.0),
-                    )
-                    db.session.add(dish)
-
-            db.session.commit()
-            print(f"Migrated {len(dishes_data)} dishes")
-
-            # Migrate Reviews
-            print("Migrating reviews...")
-            review_count = 0
-            for dish_data in dishes_data:
-                dish = Dish.query.get(dish_data["id"])
-                if dish and "reviews" in dish_data:
-                    for review_data in dish_data["reviews"]:
-                        # Find the user
-                        user = User.query.filter_by(
-                            username=review_data["user"]
-                        ).first()
-                        if user:
-                            # Check if review already exists
-                            existing_review = Review.query.filter_by(
-                                dish_id=dish.id, user_id=user.id
-                            ).first()
-
-                            if not existing_review:
-                                # Parse date
-                                review_date = datetime.strptime(
-                                    review_data["date"], "%Y-%m-%d"
-                                ).date()
-
-                                review = Review(
-                                    dish_id=dish.id,
-                                    user_id=user.id,
-                                    rating=int(
-                                        float(review_data["rating"])
-                                    ),  # Handle float ratings
-                                    comment=review_data["comment"],
-                                    date=review_date,
-                                )
-                                db.session.add(review)
-                                review_count += 1
+        # Migrate Users
+        if USERS_PATH:
+            print(f"Migrating users from {os.path.basename(USERS_PATH)}...")
+            user_ids = importer.import_users(importer.iter_json_records(USERS_PATH))
 
-            db.session.commit()
-            print(f"Migrated {review_count} reviews")
+        # Migrate Dishes and their reviews
+        if DISHES_PATH:
+            print(
+                f"Migrating dishes and reviews from {os.path.basename(DISHES_PATH)}..."
+            )
+            importer.import_dishes(importer.iter_json_records(DISHES_PATH), user_ids)
 
-            # Update average ratings
-            print("Updating average ratings...")
-            for dish in Dish.query.all():
-                dish.update_avg_rating()
+        print("Updating ratings, dashboard rollups and search index...")
+        importer.finish_import()
 
         print("Data migration completed successfully!")
 
@@ -0,0 +1,157 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from sqlalchemy import bindparam, tuple_
+
+# Keyset (cursor) pagination
+#
+# Instead of OFFSET, each page remembers the sort key of its last row in an
+# opaque cursor, and the next page continues with WHERE (keys) > (cursor).
+# With an index on the sort keys every page costs the same, however deep.
+#
+# A cursor also records the listing it came from (its "scope", e.g. the
+# sort order and search query) and is rejected with InvalidCursor when it
+# is used with another one, or when its values don't fit the sort keys.
+DEFAULT_PAGE_SIZE = 24
+MAX_PAGE_SIZE = 100
+
+
+class InvalidCursor(ValueError):
+    """Raised for a cursor that can't be decoded or doesn't fit the listing"""
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict) and "dt" in value:
+        return datetime.fromisoformat(value["dt"])
+    return value
+
+
+def _check_value(value, type_):
+    """Raise InvalidCursor unless `value` can be bound as a `type_` key"""
+    try:
+        expected = type_.python_type
+    except NotImplementedError:
+        expected = None
+    if value is None:
+        return
+    if expected is datetime:
+        ok = isinstance(value, datetime)
+    elif expected in (int, float):
+        ok = isinstance(value, (int, float)) and not isinstance(value, bool)
+        if expected is int:
+            ok = ok and float(value).is_integer()
+    elif expected is str:
+        ok = isinstance(value, str)
+    else:
+        ok = isinstance(value, (str, int, float)) and not isinstance(value, bool)
+    if not ok:
+        raise InvalidCursor(f"cursor value {value!r} does not fit the sort order")
+
+
+def encode_cursor(values, scope=None):
+    """Encode a row's sort key values (and the listing's scope) as a token"""
+    payload = {"s": scope, "v": [_encode_value(v) for v in values]}
+    raw = json.dumps(payload, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token, keys=None, scope=None):
+    """
+    The sort key values of a token produced by encode_cursor(). With `keys`,
+    the token must also come from a listing with the same `scope` and hold
+    one value of the right type per key.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        payload = json.loads(raw)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise InvalidCursor(str(e)) from e
+    if not isinstance(payload, dict) or not isinstance(payload.get("v"), list):
+        raise InvalidCursor("cursor must encode a scope and a list of values")
+    try:
+        values = [_decode_value(v) for v in payload["v"]]
+    except (TypeError, ValueError) as e:
+        raise InvalidCursor(str(e)) from e
+    if keys is not None:
+        if payload.get("s") != scope:
+            raise InvalidCursor("cursor belongs to another listing")
+        if len(values) != len(keys):
+            raise InvalidCursor("cursor does not match the sort order")
+        for key, value in zip(keys, values):
+            _check_value(value, key.type)
+    return values
+
+
+def parse_limit(value, default=DEFAULT_PAGE_SIZE):
+    """Clamp a user supplied page size to 1..MAX_PAGE_SIZE"""
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def page_statement(stmt, keys, descending=False, limit=None, cursor=None, scope=None):
+    """
+    The query for one page of `stmt` ordered by `keys`: rows after the
+    cursor, with the sort keys appended and one row beyond the limit.
+    Returns (stmt, width, limit); feed the rows to split_page().
+    """
+    limit = limit or DEFAULT_PAGE_SIZE
+    width = len(stmt.column_descriptions)
+
+    if cursor:
+        values = decode_cursor(cursor, keys, scope)
+        bound = tuple_(
+            *[
+                bindparam(None, value, type_=key.type)
+                for key, value in zip(keys, values)
+            ]
+        )
+        position = tuple_(*keys)
+        stmt = stmt.where(position < bound if descending else position > bound)
+
+    stmt = (
+        stmt.add_columns(*[key.label(f"_sort_key_{i}") for i, key in enumerate(keys)])
+        .order_by(None)
+        .order_by(*[key.desc() if descending else key for key in keys])
+        .limit(limit + 1)
+    )
+    return stmt, width, limit
+
+
+def split_page(rows, width, limit, scope=None):
+    """(items, next_cursor) from the rows of a page_statement() query"""
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][width:], scope)
+
+    items = [row[0] if width == 1 else tuple(row[:width]) for row in rows]
+    return items, next_cursor
+
+
+def paginate(
+    session, stmt, keys, descending=False, limit=None, cursor=None, scope=None
+):
+    """
+    Fetch one page of `stmt` ordered by `keys`.
+
+    `keys` are the sort expressions, all in the same direction, and must end
+    in a unique column (usually the primary key) so the order is stable.
+    `scope` is any JSON value identifying the listing (sort order, search
+    query); cursors only work within the scope they were issued for.
+    Returns (items, next_cursor); next_cursor is None on the last page.
+    Items are the statement's single entity/column, or a tuple of its
+    selected columns.
+    """
+    stmt, width, limit = page_statement(stmt, keys, descending, limit, cursor, scope)
+    return split_page(session.execute(stmt).all(), width, limit, scope)
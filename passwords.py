@@ -0,0 +1,204 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from flask import current_app, has_app_context
+from werkzeug.security import (
+    DEFAULT_PBKDF2_ITERATIONS,
+    check_password_hash,
+    generate_password_hash,
+)
+
+# Password hashing
+#
+# Hashing is deliberately slow and CPU-bound, so bulk user creation (the JSON
+# import, synthetic_user_generator.py) spreads it over a process pool. Set
+# PASSWORD_HASH_WORKERS to cap the pool size; 1 hashes in-process.
+#
+# Password policy
+#
+# PASSWORD_HASH_METHOD is the werkzeug method every stored hash should use,
+# e.g. "pbkdf2:sha256:600000" or "scrypt:32768:8:1". A successful login
+# whose stored hash uses anything else (cheaper or dearer) is re-hashed with
+# the target, so verification cost, and with it login latency, converges on
+# one known value. PASSWORD_VERIFY_THREADS > 0 caps how many verifications
+# run at once: each hash is handed to a pool of that many threads. This is
+# a concurrency cap, not an async offload; the request thread still waits
+# for its result, so a login burst queues for the pool instead of running
+# every hash in parallel and slowing all of them (and the rest of the
+# server) down. The wait itself doesn't hold the GIL.
+DEFAULT_HASH_METHOD = f"pbkdf2:sha256:{DEFAULT_PBKDF2_ITERATIONS}"
+
+
+def _setting(name, default=None):
+    if has_app_context():
+        value = current_app.config.get(name)
+    else:
+        value = os.getenv(name)
+    return default if value in (None, "") else value
+
+
+def hash_workers():
+    """Worker processes to use for bulk hashing"""
+    return max(int(_setting("PASSWORD_HASH_WORKERS", os.cpu_count() or 1)), 1)
+
+
+def canonical_method(method):
+    """Spell out werkzeug's defaults: "pbkdf2" -> "pbkdf2:sha256:600000" """
+    name, *args = method.split(":")
+    if name == "pbkdf2":
+        hash_name = args[0] if args else "sha256"
+        iterations = int(args[1]) if len(args) > 1 else DEFAULT_PBKDF2_ITERATIONS
+        return f"pbkdf2:{hash_name}:{iterations}"
+    if name == "scrypt":
+        n, r, p = map(int, args) if args else (2**15, 8, 1)
+        return f"scrypt:{n}:{r}:{p}"
+    return method
+
+
+def target_method():
+    """The hash method new and re-hashed passwords should use"""
+    return canonical_method(_setting("PASSWORD_HASH_METHOD", DEFAULT_HASH_METHOD))
+
+
+def hash_password(password, method=None):
+    """Hash one password with the target (or the given) method"""
+    return generate_password_hash(password, method=method or target_method())
+
+
+def needs_rehash(password_hash, method=None):
+    """Whether a stored hash was made with something other than the target"""
+    stored_method = password_hash.split("$", 1)[0]
+    return canonical_method(stored_method) != (method or target_method())
+
+
+class VerificationMetrics:
+    """Timing of password verifications, for /admin/metrics"""
+
+    def __init__(self, window=1000):
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=window)
+        self.count = 0
+        self.failures = 0
+        self.rehashes = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def record(self, seconds, ok):
+        with self._lock:
+            self._recent.append(seconds)
+            self.count += 1
+            self.failures += not ok
+            self.total_seconds += seconds
+            self.max_seconds = max(self.max_seconds, seconds)
+
+    def record_rehash(self):
+        with self._lock:
+            self.rehashes += 1
+
+    def stats(self):
+        with self._lock:
+            recent = sorted(self._recent)
+            count, total = self.count, self.total_seconds
+
+        def percentile(p):
+            if not recent:
+                return None
+            index = min(int(p * len(recent) / 100), len(recent) - 1)
+            return round(recent[index] * 1000, 2)
+
+        return {
+            "count": count,
+            "failures": self.failures,
+            "rehashes": self.rehashes,
+            "avg_ms": round(total * 1000 / count, 2) if count else None,
+            "p50_ms": percentile(50),
+            "p99_ms": percentile(99),
+            "max_ms": round(self.max_seconds * 1000, 2),
+        }
+
+
+verification_metrics = VerificationMetrics()
+_verify_pool = None
+_verify_pool_lock = threading.Lock()
+
+
+def _verify_executor():
+    global _verify_pool
+    threads = int(_setting("PASSWORD_VERIFY_THREADS", 0))
+    if threads <= 0:
+        return None
+    with _verify_pool_lock:
+        if _verify_pool is None:
+            _verify_pool = ThreadPoolExecutor(
+                max_workers=threads, thread_name_prefix="password-verify"
+            )
+    return _verify_pool
+
+
+def verify_password(password_hash, password):
+    """
+    check_password_hash(), timed. With PASSWORD_VERIFY_THREADS set, the
+    hash runs on the shared verification pool (which caps concurrent
+    hashes) and the calling thread waits for it
+    """
+    started = time.perf_counter()
+    executor = _verify_executor()
+    if executor is None:
+        ok = check_password_hash(password_hash, password)
+    else:
+        ok = executor.submit(check_password_hash, password_hash, password).result()
+    verification_metrics.record(time.perf_counter() - started, ok)
+    return ok
+
+
+def check_and_upgrade(user, password):
+    """
+    Verify a login attempt. On success, re-hash the stored password if it
+    doesn't match the policy; the caller commits.
+    """
+    if not verify_password(user.password_hash, password):
+        return False
+    if needs_rehash(user.password_hash):
+        user.password_hash = hash_password(password)
+        verification_metrics.record_rehash()
+    return True
+
+
+class PasswordHasher:
+    """
+    Hash many passwords across a process pool. Results come back in input
+    order, so callers can zip them with their rows and keep writes ordered.
+
+        with PasswordHasher() as hasher:
+            hashes = hasher.hash_many(passwords)
+    """
+
+    def __init__(self, workers=None, method=None):
+        self.workers = hash_workers() if workers is None else max(int(workers), 1)
+        # Resolved here: the worker processes have no app config
+        self.method = method or target_method()
+        self._pool = None
+
+    def __enter__(self):
+        if self.workers > 1:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def hash_many(self, passwords):
+        passwords = list(passwords)
+        if self._pool is None or len(passwords) < 2:
+            return [hash_password(p, self.method) for p in passwords]
+        # A few chunks per worker keeps them busy without per-item overhead
+        chunksize = max(len(passwords) // (self.workers * 4), 1)
+        methods = [self.method] * len(passwords)
+        return list(
+            self._pool.map(hash_password, passwords, methods, chunksize=chunksize)
+        )
@@ -0,0 +1,178 @@
+from contextlib import contextmanager
+
+from sqlalchemy import event, func, select, text
+from sqlalchemy.orm import (
+    configure_mappers,
+    joinedload,
+    lazyload,
+    load_only,
+    selectinload,
+)
+
+from models import db, Dish, DishTag, Review, Tag
+
+# Loader option presets, one per kind of view
+#
+# Each preset loads exactly the relationships its view touches, in a fixed
+# number of queries however many rows there are. Dish.tag_links is already
+# loaded "selectin" by default, and review counts come from the stored
+# Dish.review_count column.
+
+
+def dish_document_options():
+    """Views served from stored DishDocuments: only the id and version"""
+    return (load_only(Dish.id, Dish.version), lazyload(Dish.tag_links))
+
+
+def dish_full_options():
+    """Dish.to_dict() and the detail page: every review and its author"""
+    configure_mappers()  # Review.author is a backref
+    return (selectinload(Dish.reviews).joinedload(Review.author),)
+
+
+def review_row_options():
+    """Review listings that show the dish name and the author"""
+    configure_mappers()
+    return (joinedload(Review.dish), joinedload(Review.author))
+
+
+# Dish cards
+#
+# The card grid (list_dishes) selects just the columns a card shows and maps
+# the rows onto DishCard objects instead of Dish instances: no identity map,
+# no attribute instrumentation, no description beyond what a card displays,
+# and the first few tags from one extra query.
+CARD_DESCRIPTION_LENGTH = 300
+CARD_TAGS = 3
+
+
+class DishCard:
+    """What dishes.html renders for one dish"""
+
+    __slots__ = (
+        "id",
+        "name",
+        "image",
+        "image_variants",
+        "description",
+        "avg_rating",
+        "review_count",
+        "tag_count",
+        "version",
+        "tags",
+    )
+
+    def __init__(
+        self,
+        id,
+        name,
+        image,
+        image_variants,
+        description,
+        avg_rating,
+        review_count,
+        tag_count,
+        version,
+    ):
+        if description and len(description) > CARD_DESCRIPTION_LENGTH:
+            description = description[:CARD_DESCRIPTION_LENGTH].rstrip() + "\u2026"
+        self.id = id
+        self.name = name
+        self.image = image
+        self.image_variants = image_variants
+        self.description = description
+        self.avg_rating = avg_rating
+        self.review_count = review_count
+        self.tag_count = tag_count
+        self.version = version  # keys the cached card markup
+        self.tags = []  # the first CARD_TAGS, filled in by dish_cards()
+
+
+def dish_card_columns():
+    """Columns for a select() of DishCard rows, in constructor order"""
+    tag_count = (
+        select(func.count())
+        .where(DishTag.dish_id == Dish.id)
+        .correlate(Dish)
+        .scalar_subquery()
+    )
+    return (
+        Dish.id,
+        Dish.name,
+        Dish.image,
+        Dish.image_variants,
+        # One character more than shown, so the card knows to add an ellipsis
+        func.substr(Dish.description, 1, CARD_DESCRIPTION_LENGTH + 1),
+        Dish.avg_rating,
+        Dish.review_count,
+        tag_count,
+        Dish.version,
+    )
+
+
+def dish_cards(rows, session=None):
+    """DishCards for rows of dish_card_columns(), with their first tags"""
+    session = session if session is not None else db.session
+    cards = [DishCard(*row) for row in rows]
+    by_id = {card.id: card for card in cards}
+    if by_id:
+        tags = session.execute(
+            select(DishTag.dish_id, Tag.name)
+            .join(Tag, Tag.id == DishTag.tag_id)
+            .where(DishTag.dish_id.in_(by_id), DishTag.position < CARD_TAGS)
+            .order_by(DishTag.dish_id, DishTag.position)
+        )
+        for dish_id, name in tags:
+            by_id[dish_id].tags.append(name)
+    return cards
+
+
+# Query counting (used by check_queries.py)
+class QueryCounter:
+    def __init__(self):
+        self.statements = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+
+@contextmanager
+def count_queries(engine=None):
+    """
+    Record every SQL statement sent to the engine inside the block (by
+    default, to any of the app's engines, so replica reads count too)
+    """
+    engines = [engine] if engine is not None else list(db.engines.values())
+    counter = QueryCounter()
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, many):
+        counter.statements.append(statement)
+
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield counter
+    finally:
+        for engine in engines:
+            event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+# Query plans (used by check_queries.py)
+def query_plan(stmt, session=None):
+    """SQLite's EXPLAIN QUERY PLAN lines for a select(), e.g. "SCAN dishes" """
+    session = session if session is not None else db.session
+    compiled = stmt.compile(
+        dialect=session.get_bind().dialect, compile_kwargs={"literal_binds": True}
+    )
+    rows = session.execute(text(f"EXPLAIN QUERY PLAN {compiled}"))
+    return [detail for _, _, _, detail in rows]
+
+
+def full_scans(stmt, table_name, session=None):
+    """The plan lines in which `stmt` reads all of `table_name`"""
+    return [
+        line
+        for line in query_plan(stmt, session)
+        if line == f"SCAN {table_name}" or line.startswith(f"SCAN {table_name} ")
+    ]
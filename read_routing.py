@@ -0,0 +1,108 @@
+import time
+from functools import wraps
+
+from flask import current_app, session
+from flask_sqlalchemy.session import Session as FlaskSession
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.sql.dml import UpdateBase
+
+# Read/write session routing
+#
+# Views decorated with @read_routing.read_only run their queries on the
+# "replica" bind: DATABASE_REPLICA_URL if set, otherwise the primary SQLite
+# file opened with mode=ro. Read-only connections never take the writer
+# lock, so with WAL any number of processes can serve reads while /rate
+# commits. Everything else, including any flush or INSERT/UPDATE/DELETE
+# issued from a read-only view, goes to the primary.
+#
+# A real replica lags the primary, so after a request commits, the user's
+# reads stay on the primary for REPLICA_STICKY_SECONDS (default 5 with a
+# configured replica, 0 for the local read-only file, which never lags).
+# A review therefore shows up on the page /rate redirects to.
+REPLICA_BIND = "replica"
+READ_ONLY = "read_only"
+_WROTE_AT = "_db_wrote_at"
+
+
+def read_only_url(url):
+    """The primary SQLite file opened read-only, or None for other databases"""
+    url = make_url(url)
+    if url.get_backend_name() != "sqlite" or url.database in (None, "", ":memory:"):
+        return None
+    if url.query.get("uri"):
+        url = url.update_query_dict({"mode": "ro"})
+    else:
+        url = url.set(
+            database=f"file:{url.database}",
+            query=dict(url.query, mode="ro", uri="true"),
+        )
+    return url.render_as_string(hide_password=False)
+
+
+def recently_wrote(session_data, sticky_seconds):
+    """Whether a user's reads should stay on the primary for now"""
+    wrote_at = session_data.get(_WROTE_AT)
+    return (
+        bool(sticky_seconds and wrote_at) and time.time() - wrote_at <= sticky_seconds
+    )
+
+
+class RoutingSession(FlaskSession):
+    """db.session class that sends read-only sessions' queries to the replica"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (
+            bind is None
+            and self.info.get(READ_ONLY)
+            and not self._flushing
+            and not isinstance(clause, UpdateBase)
+        ):
+            replica = self._db.engines.get(REPLICA_BIND)
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def _record_commit(session):
+    session.info["committed"] = True
+
+
+class ReadRouting:
+    def __init__(self, db):
+        self.db = db
+
+    def init_app(self, app):
+        """Register the replica bind; call before db.init_app()"""
+        primary = app.config["SQLALCHEMY_DATABASE_URI"]
+        replica = app.config.get("DATABASE_REPLICA_URL")
+        app.config.setdefault("REPLICA_STICKY_SECONDS", 5 if replica else 0)
+        replica = replica or read_only_url(primary)
+        if replica is not None:
+            binds = app.config.setdefault("SQLALCHEMY_BINDS", {})
+            binds.setdefault(REPLICA_BIND, replica)
+        app.after_request(self._remember_writes)
+        app.extensions["read_routing"] = self
+
+    def read_only(self, view):
+        """Run a view's queries on the replica, unless the user just wrote"""
+
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not recently_wrote(
+                session, current_app.config["REPLICA_STICKY_SECONDS"]
+            ):
+                self.db.session.info[READ_ONLY] = True
+            return view(*args, **kwargs)
+
+        return wrapper
+
+    def _remember_writes(self, response):
+        if (
+            current_app.config["REPLICA_STICKY_SECONDS"]
+            and self.db.session.registry.has()
+            and self.db.session.info.get("committed")
+        ):
+            session[_WROTE_AT] = time.time()
+        return response
@@ -0,0 +1,78 @@
+import hashlib
+from functools import wraps
+
+from flask import current_app, request
+
+from cache import Cache, MemoryBackend
+
+# Versioned response cache
+#
+# Responses are cached under (endpoint, view args, query params, version),
+# where the version is a counter bumped by every write that could change the
+# response (Dish.version for a single dish, catalog_version() for listings).
+# A write therefore never needs to find and evict stale entries: the next
+# request simply looks under a new key, and the old entry ages out of the LRU.
+# Because the key determines the body, it also serves as a strong ETag, so a
+# matching If-None-Match is answered with 304 before the view runs at all.
+
+
+class ResponseCache:
+    def __init__(self, max_entries=1024, max_bytes=32 * 1024 * 1024):
+        # Always per process: entries never go stale, so sharing them between
+        # workers would only add a round trip
+        self.backend = MemoryBackend(max_entries=max_entries, max_bytes=max_bytes)
+        self.entries = Cache(self.backend, name="api")
+
+    def init_app(self, app):
+        lru = self.backend.entries
+        lru.max_entries = app.config.get("API_CACHE_MAX_ENTRIES", lru.max_entries)
+        lru.max_bytes = app.config.get("API_CACHE_MAX_BYTES", lru.max_bytes)
+        app.extensions["response_cache"] = self
+
+    def cached(self, version_for):
+        """
+        Cache a view's successful responses. `version_for(**view_args)`
+        returns the current version of the data the response depends on, or
+        None to bypass the cache (e.g. so the view can 404).
+        """
+
+        def decorator(view):
+            @wraps(view)
+            def wrapper(**view_args):
+                version = version_for(**view_args)
+                if version is None:
+                    return view(**view_args)
+
+                key = (
+                    request.endpoint,
+                    tuple(sorted(view_args.items())),
+                    tuple(sorted(request.args.items(multi=True))),
+                    version,
+                )
+                etag = hashlib.sha1(repr(key).encode()).hexdigest()
+                if request.if_none_match.contains(etag):
+                    return self._make_response(b"", etag, 304)
+
+                body = self.entries.get(key)
+                if body is None:
+                    response = current_app.make_response(view(**view_args))
+                    if response.status_code != 200:
+                        return response
+                    body = response.get_data()
+                    self.entries.set(key, body)
+                return self._make_response(body, etag)
+
+            return wrapper
+
+        return decorator
+
+    @staticmethod
+    def _make_response(body, etag, status=200):
+        response = current_app.response_class(
+            body, status=status, mimetype="application/json"
+        )
+        response.set_etag(etag)
+        # Authenticated content: clients may keep it but must revalidate
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        return response
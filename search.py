@@ -0,0 +1,261 @@
+import re
+
+from sqlalchemy import (
+    Float,
+    event,
+    false,
+    func,
+    inspect,
+    literal,
+    literal_column,
+    or_,
+    select,
+    table,
+    text,
+    union_all,
+)
+from sqlalchemy.orm import Session
+
+from models import db, Dish, DishTag, Tag
+
+# Full-text search index (SQLite FTS5)
+#
+# The index is a standalone FTS5 table whose rowid is the dish id. It is kept
+# in sync from the ORM flush hooks below, and rebuilt in one pass by
+# ensure_search_index() when it is first created (or on demand).
+SEARCH_TABLE = "dish_search"
+
+# bm25() column weights: name, description, tags
+NAME_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+TAGS_WEIGHT = 5.0
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def is_available(bind=None):
+    """FTS5 is only used on SQLite; other databases fall back to ILIKE"""
+    bind = bind if bind is not None else db.engine
+    return bind.dialect.name == "sqlite"
+
+
+def ensure_search_index(rebuild=False):
+    """Create the FTS table if missing and (re)populate it when needed"""
+    if not is_available():
+        return False
+
+    exists = inspect(db.engine).has_table(SEARCH_TABLE)
+    if not exists:
+        db.session.execute(
+            text(
+                f"CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5("
+                "name, description, tags, "
+                "tokenize = 'unicode61 remove_diacritics 2', "
+                "prefix = '2 3')"
+            )
+        )
+
+    if rebuild or not exists:
+        rebuild_search_index()
+    db.session.commit()
+    return True
+
+
+def rebuild_search_index():
+    """Re-index every dish from scratch"""
+    connection = db.session.connection()
+    connection.execute(text(f"DELETE FROM {SEARCH_TABLE}"))
+    for dish in Dish.query.yield_per(500):
+        _write_entry(connection, dish)
+
+
+def _document_for(dish):
+    return {
+        "id": dish.id,
+        "name": dish.name or "",
+        "description": dish.description or "",
+        "tags": " ".join(dish.tags),
+    }
+
+
+def _write_entry(connection, dish):
+    connection.execute(
+        text(
+            f"INSERT INTO {SEARCH_TABLE} (rowid, name, description, tags) "
+            "VALUES (:id, :name, :description, :tags)"
+        ),
+        _document_for(dish),
+    )
+
+
+def _delete_entry(connection, dish_id):
+    connection.execute(
+        text(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = :id"), {"id": dish_id}
+    )
+
+
+def _needs_reindex(dish):
+    state = inspect(dish)
+    return any(
+        state.attrs[name].history.has_changes()
+        for name in ("name", "description", "tag_links")
+    )
+
+
+@event.listens_for(Session, "after_flush")
+def _sync_search_index(session, flush_context):
+    """Mirror dish inserts/updates/deletes into the FTS table"""
+    new = [obj for obj in session.new if isinstance(obj, Dish)]
+    dirty = [
+        obj for obj in session.dirty if isinstance(obj, Dish) and _needs_reindex(obj)
+    ]
+    deleted = [obj for obj in session.deleted if isinstance(obj, Dish)]
+    if not (new or dirty or deleted):
+        return
+
+    connection = session.connection()
+    if not is_available(connection) or not inspect(connection).has_table(SEARCH_TABLE):
+        return
+
+    for dish in dirty + deleted:
+        _delete_entry(connection, dish.id)
+    for dish in new + dirty:
+        _write_entry(connection, dish)
+
+
+# Query helpers
+def split_terms(query):
+    """Split a comma separated query into lower-cased terms"""
+    return [term.strip().lower() for term in (query or "").split(",") if term.strip()]
+
+
+def exact_tag_terms_statement(terms):
+    return select(func.lower(Tag.name)).where(func.lower(Tag.name).in_(terms))
+
+
+def exact_tag_terms(terms):
+    """The subset of terms that name an existing tag (case-insensitive)"""
+    if not terms:
+        return set()
+    rows = db.session.execute(exact_tag_terms_statement(terms))
+    return set(rows.scalars())
+
+
+def tagged_dish_ids(tag_names):
+    """Indexed lookup of the ids of dishes carrying any of the given tags"""
+    return (
+        select(DishTag.dish_id)
+        .join(Tag, Tag.id == DishTag.tag_id)
+        .where(func.lower(Tag.name).in_(tag_names))
+    )
+
+
+def match_expression(terms, tag_terms=()):
+    """
+    Build an FTS5 MATCH expression from a list of search terms.
+
+    Each term must match all of its words (as prefixes), and terms are OR-ed
+    together, e.g. ["butter chick", "pho"] becomes
+    ("butter"* AND "chick"*) OR ("pho"*). Terms that exactly name a tag are
+    answered from the tag tables, so they only search names and descriptions
+    here; otherwise "thai" would also match a "Thailand" tag.
+    """
+    clauses = []
+    for term in terms:
+        tokens = _TOKEN_RE.findall(term)
+        if not tokens:
+            continue
+        clause = "(" + " AND ".join(f'"{token}"*' for token in tokens) + ")"
+        if term in tag_terms:
+            clause = "({name description} : " + clause + ")"
+        clauses.append(clause)
+    return " OR ".join(clauses) or None
+
+
+def ranked_matches(terms, tag_terms=()):
+    """
+    Select of (dish_id, score) for dishes matching the terms, where a lower
+    score is a better BM25 match. Returns None if nothing to match.
+    """
+    expression = match_expression(terms, tag_terms)
+    if expression is None:
+        return None
+
+    return (
+        select(
+            literal_column("rowid").label("dish_id"),
+            func.bm25(
+                literal_column(SEARCH_TABLE),
+                NAME_WEIGHT,
+                DESCRIPTION_WEIGHT,
+                TAGS_WEIGHT,
+                type_=Float,
+            ).label("score"),
+        )
+        .select_from(table(SEARCH_TABLE))
+        .where(literal_column(SEARCH_TABLE).op("MATCH")(expression))
+    )
+
+
+def search_candidates(terms, tag_terms=()):
+    """
+    Subquery of (dish_id, score), one row per matching dish: the FTS
+    matches plus the dishes tagged with one of `tag_terms`. Tag-only
+    matches have no BM25 score and rank after text matches. Returns None
+    if nothing can match.
+    """
+    matches = ranked_matches(terms, tag_terms)
+    if not tag_terms:
+        return matches.subquery("search_matches") if matches is not None else None
+
+    tagged = tagged_dish_ids(tag_terms).add_columns(literal(0.0).label("score"))
+    candidates = union_all(*[q for q in (matches, tagged) if q is not None])
+    candidates = candidates.subquery("search_candidates")
+    return (
+        select(
+            candidates.c.dish_id,
+            func.min(candidates.c.score).label("score"),
+        )
+        .group_by(candidates.c.dish_id)
+        .subquery("search_matches")
+    )
+
+
+def fallback_condition(terms):
+    """ILIKE conditions for databases without FTS5"""
+    conditions = []
+    for term in terms:
+        conditions.append(
+            or_(
+                Dish.name.ilike(f"%{term}%"),
+                Dish.description.ilike(f"%{term}%"),
+                Dish.tag_links.any(DishTag.tag.has(Tag.name.ilike(f"%{term}%"))),
+            )
+        )
+    return or_(*conditions) if conditions else false()
+
+
+def apply_search(stmt, query, tag_terms=None, use_fts=None):
+    """
+    Restrict a select() over Dish to dishes matching a comma separated
+    query. Returns (stmt, score), where score is a relevance expression to
+    order by (lower is better), or None when the query has no terms.
+
+    Callers without the Flask-SQLAlchemy session (the async API) pass in
+    `tag_terms` (from exact_tag_terms_statement()) and `use_fts`.
+    """
+    terms = split_terms(query)
+    if not terms:
+        return stmt, None
+
+    if not (is_available() if use_fts is None else use_fts):
+        return stmt.where(fallback_condition(terms)), literal(0.0)
+
+    if tag_terms is None:
+        tag_terms = exact_tag_terms(terms)
+    # Dishes are only looked up by id for the candidates, so a search never
+    # scans the dishes table, whatever the sort order
+    matches = search_candidates(terms, tag_terms)
+    if matches is None:
+        return stmt.where(false()), literal(0.0)
+    return stmt.join(matches, matches.c.dish_id == Dish.id), matches.c.score
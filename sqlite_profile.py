@@ -0,0 +1,134 @@
+import os
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+
+# SQLite engine profile
+#
+# The defaults (rollback journal, synchronous=FULL, 2 MB page cache) make
+# every /rate write block all readers of food_app.db. The profile below is
+# applied to each new connection through a connect event:
+#
+#   journal_mode=WAL      readers and the single writer no longer block
+#                         each other; the setting persists in the file
+#   synchronous=NORMAL    with WAL, fsync at checkpoints rather than every
+#                         commit; a power loss can drop the last commits
+#                         but never corrupts the database
+#   busy_timeout          writers queue for the lock instead of failing
+#                         with "database is locked"
+#   cache_size, mmap_size page cache per connection and memory-mapped I/O
+#   temp_store=MEMORY     sorts and temporary indexes stay off disk
+#
+# Override single values with SQLITE_PRAGMAS, e.g.
+# "cache_size=-20000,mmap_size=0". Connections are pooled per process
+# (SQLITE_POOL_SIZE kept open, up to SQLITE_MAX_OVERFLOW more under load),
+# so size the pool to the server's worker threads.
+DEFAULT_PRAGMAS = {
+    # busy_timeout first, so switching journal mode waits for other writers
+    "busy_timeout": 5000,  # ms
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -64000,  # negative: KiB, so 64 MB
+    "mmap_size": 256 * 1024 * 1024,
+    "temp_store": "MEMORY",
+}
+DEFAULT_POOL_SIZE = 10
+DEFAULT_MAX_OVERFLOW = 20
+
+# PRAGMA reads return numbers for these
+_PRAGMA_NAMES = {
+    "synchronous": {0: "OFF", 1: "NORMAL", 2: "FULL", 3: "EXTRA"},
+    "temp_store": {0: "DEFAULT", 1: "FILE", 2: "MEMORY"},
+}
+
+
+def parse_pragmas(value):
+    """DEFAULT_PRAGMAS updated from a "name=value,name=value" string"""
+    pragmas = dict(DEFAULT_PRAGMAS)
+    for item in (value or "").split(","):
+        name, sep, setting = item.partition("=")
+        if sep and name.strip():
+            pragmas[name.strip().lower()] = setting.strip()
+    return pragmas
+
+
+def is_sqlite_file(url):
+    url = make_url(url)
+    return url.get_backend_name() == "sqlite" and url.database not in (
+        None,
+        "",
+        ":memory:",
+    )
+
+
+def pool_options(config):
+    """create_engine() pool arguments for a file database"""
+    if not is_sqlite_file(config["SQLALCHEMY_DATABASE_URI"]):
+        return {}
+    return {
+        "pool_size": int(config.get("SQLITE_POOL_SIZE", DEFAULT_POOL_SIZE)),
+        "max_overflow": int(config.get("SQLITE_MAX_OVERFLOW", DEFAULT_MAX_OVERFLOW)),
+    }
+
+
+def configure(app):
+    """Fill in the profile's config; call before db.init_app()"""
+    app.config.setdefault("SQLITE_PRAGMAS", parse_pragmas(os.getenv("SQLITE_PRAGMAS")))
+    app.config.setdefault(
+        "SQLITE_POOL_SIZE", int(os.getenv("SQLITE_POOL_SIZE", DEFAULT_POOL_SIZE))
+    )
+    app.config.setdefault(
+        "SQLITE_MAX_OVERFLOW",
+        int(os.getenv("SQLITE_MAX_OVERFLOW", DEFAULT_MAX_OVERFLOW)),
+    )
+    options = app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", {})
+    for name, value in pool_options(app.config).items():
+        options.setdefault(name, value)
+
+
+def apply(engine, pragmas):
+    """Set `pragmas` on every new connection of a SQLite engine"""
+    if engine.dialect.name != "sqlite" or not pragmas:
+        return
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
+
+def read_only_pragmas(pragmas):
+    """`pragmas` minus the ones a mode=ro connection can't set"""
+    return {name: value for name, value in pragmas.items() if name != "journal_mode"}
+
+
+def effective_pragmas(connection, names=DEFAULT_PRAGMAS):
+    """{pragma: value} as SQLite reports it on `connection`"""
+    values = {}
+    for name in names:
+        value = connection.exec_driver_sql(f"PRAGMA {name}").scalar()
+        values[name] = _PRAGMA_NAMES.get(name, {}).get(value, value)
+    return values
+
+
+def report(engine, pragmas):
+    """One line describing the pragmas and pool in effect, for startup logs"""
+    if engine.dialect.name != "sqlite":
+        return f"Database: {engine.dialect.name} (no SQLite profile)"
+    with engine.connect() as connection:
+        values = effective_pragmas(connection, pragmas)
+    settings = " ".join(f"{name}={value}" for name, value in values.items())
+    pool = engine.pool
+    if isinstance(pool, QueuePool):
+        settings += f" pool_size={pool.size()}"
+    line = f"SQLite profile: {settings} ({type(pool).__name__})"
+    requested = str(pragmas.get("journal_mode", "")).lower()
+    if requested and str(values.get("journal_mode", "")).lower() != requested:
+        # e.g. in-memory databases, or file systems without shared memory
+        line += f" (journal_mode={requested} was not applied)"
+    return line
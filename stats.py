@@ -0,0 +1,197 @@
+import math
+from datetime import date, datetime, timedelta
+
+from models import (
+    db,
+    DailyDishReviews,
+    Dish,
+    MonthlySignups,
+    RatingTotal,
+    Review,
+    User,
+    UserReviewStats,
+)
+
+# Aggregates for the admin dashboard
+#
+# Each helper answers its question with a fixed number of grouped queries,
+# whatever the size of the date window, and fills gaps in Python. Counts
+# come from the rollup tables in models.py rather than the reviews table
+# (except the catalog totals, which are plain counts).
+GRANULARITIES = ("day", "week", "month")
+LENGTH_PERCENTILES = (50, 90, 99)
+
+
+def _as_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+def bucket_start(day, granularity):
+    """First day of the day/week (Monday)/month bucket containing `day`"""
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    if granularity == "month":
+        return day.replace(day=1)
+    return day
+
+
+def daily_review_counts(start_date, end_date):
+    """{date: review count} for start_date..end_date inclusive, one query"""
+    rows = (
+        db.session.query(
+            DailyDishReviews.day, db.func.sum(DailyDishReviews.review_count)
+        )
+        .filter(DailyDishReviews.day >= start_date, DailyDishReviews.day <= end_date)
+        .group_by(DailyDishReviews.day)
+        .all()
+    )
+    return {_as_date(day): int(count) for day, count in rows}
+
+
+def pct_change(prev, cur):
+    if prev == 0:
+        return None if cur == 0 else 100.0
+    return round((cur - prev) * 100.0 / prev, 2)
+
+
+def review_trend(start_date, end_date, granularity="day", daily_counts=None):
+    """
+    Review counts per day/week/month between start_date and end_date
+    (inclusive), plus the percent change against the previous window of the
+    same length. Both come from a single GROUP BY over the two windows.
+
+    Returns (trend, percent_change); trend is a list of
+    {"date": bucket start, "count": n}, with empty buckets included.
+    `daily_counts(start, end)` can be swapped for another {date: count}
+    source.
+    """
+    if granularity not in GRANULARITIES:
+        granularity = "day"
+    daily_counts = daily_counts or daily_review_counts
+
+    days = (end_date - start_date).days + 1
+    prev_start = start_date - timedelta(days=days)
+    counts = daily_counts(prev_start, end_date)
+
+    buckets = {}
+    cur_count = 0
+    prev_count = 0
+    for offset in range(days * 2):
+        day = prev_start + timedelta(days=offset)
+        cnt = counts.get(day, 0)
+        if day < start_date:
+            prev_count += cnt
+            continue
+        cur_count += cnt
+        key = bucket_start(day, granularity)
+        buckets[key] = buckets.get(key, 0) + cnt
+
+    trend = [
+        {"date": key.isoformat(), "count": cnt} for key, cnt in sorted(buckets.items())
+    ]
+    return trend, pct_change(prev_count, cur_count)
+
+
+def _comment_length_at(offset):
+    """Scalar subquery: the comment length at `offset` in ascending order"""
+    return (
+        db.select(Review.comment_length)
+        .order_by(Review.comment_length)
+        .offset(offset)
+        .limit(1)
+        .scalar_subquery()
+    )
+
+
+def review_length_stats(percentiles=LENGTH_PERCENTILES):
+    """
+    Average, median and nearest-rank percentiles of review comment lengths,
+    read from the indexed Review.comment_length column in two queries.
+
+    Returns {"avg": ..., "median": ..., "p50": ..., "p90": ..., ...}; the
+    median averages the two middle values when the count is even.
+    """
+    count, avg = db.session.query(
+        db.func.count(Review.id), db.func.avg(Review.comment_length)
+    ).one()
+    if not count:
+        return {
+            "avg": 0.0,
+            "median": None,
+            **{f"p{p}": None for p in percentiles},
+        }
+
+    offsets = [(count - 1) // 2, count // 2]
+    offsets += [max(math.ceil(p * count / 100) - 1, 0) for p in percentiles]
+    values = db.session.execute(
+        db.select(*[_comment_length_at(offset) for offset in offsets])
+    ).one()
+
+    lower, upper = values[0], values[1]
+    result = {
+        "avg": round(float(avg), 2),
+        "median": lower if count % 2 else (lower + upper) / 2,
+    }
+    for p, value in zip(percentiles, values[2:]):
+        result[f"p{p}"] = value
+    return result
+
+
+def rating_distribution():
+    """{star rating: review count}, all five ratings included"""
+    counts = dict(db.session.query(RatingTotal.rating, RatingTotal.review_count))
+    return {rating: int(counts.get(rating) or 0) for rating in range(1, 6)}
+
+
+def catalog_totals():
+    """Total users, dishes and reviews, and the average rating"""
+    # Exact counts rather than rollup sums, so the headline numbers stay
+    # right whatever wrote the rows; each is one query over a single table
+    users = db.session.query(db.func.count(User.id)).scalar()
+    dishes = db.session.query(db.func.count(Dish.id)).scalar()
+    reviews, avg_rating = db.session.query(
+        db.func.count(Review.id), db.func.avg(Review.rating)
+    ).one()
+    return {
+        "users": users,
+        "dishes": dishes,
+        "reviews": reviews,
+        "avg_rating": round(avg_rating, 2) if reviews else 0.0,
+    }
+
+
+def top_reviewers(limit=10):
+    rows = (
+        db.session.query(User.id, User.username, UserReviewStats.review_count)
+        .join(UserReviewStats, UserReviewStats.user_id == User.id)
+        .filter(UserReviewStats.review_count > 0)
+        .order_by(UserReviewStats.review_count.desc(), UserReviewStats.user_id)
+        .limit(limit)
+        .all()
+    )
+    return [
+        {"id": user_id, "username": username, "review_count": int(count)}
+        for user_id, username, count in rows
+    ]
+
+
+def monthly_signups(kind, months_back=12, today=None):
+    """[{"month": "YYYY-MM", "count": n}] for the last `months_back` months"""
+    today = today or datetime.utcnow().date()
+    months = []
+    year, month = today.year, today.month
+    for _ in range(months_back):
+        months.append(f"{year:04d}-{month:02d}")
+        year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+    months.reverse()
+
+    counts = dict(
+        db.session.query(MonthlySignups.month, MonthlySignups.signup_count).filter(
+            MonthlySignups.kind == kind, MonthlySignups.month.in_(months)
+        )
+    )
+    return [{"month": key, "count": int(counts.get(key) or 0)} for key in months]
@@ -2,7 +2,6 @@ import sys
 import os
 import random
 from faker import Faker
-from werkzeug.security import generate_password_hash
 
 # Add the current directory to path so Python can find your modules
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
@@ -10,13 +9,14 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 # Import app and database models
 from app import app
 from models import db, User
+from passwords import PasswordHasher
 
 # Initialize faker
 fake = Faker()
 
 
 # Define user generation function
-def generate_users(num_users=200):
+def generate_users(num_users=200, workers=None):
     with app.app_context():
         # Check current user count
         current_count = User.query.count()
@@ -25,6 +25,7 @@ def generate_users(num_users=200):
         # Create new users
         new_users = 0
         existing_usernames = {user.username for user in User.query.all()}
+        pending = []  # (username, password)
 
         for i in range(num_users):
             # Generate a variety of username styles
@@ -93,8 +94,14 @@ def generate_users(num_users=200):
 
             # Generate a random password (8-15 chars)
             password = fake.password(length=random.randint(8, 15))
-            password_hash = generate_password_hash(password)
+            pending.append((username, password))
 
+        # Hash every password up front, spread over the worker processes
+        print(f"Hashing {len(pending)} passwords...")
+        with PasswordHasher(workers) as hasher:
+            password_hashes = hasher.hash_many(password for _, password in pending)
+
+        for (username, _), password_hash in zip(pending, password_hashes):
             # Create the user
             user = User(username=username, password_hash=password_hash)
             db.session.add(user)
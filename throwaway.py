@@ -0,0 +1,57 @@
+import os
+import tempfile
+
+# Throwaway app for the dev scripts (check_queries.py, bench_*.py)
+#
+# Importing this module points DATABASE_URL at a fresh temporary SQLite
+# file before the app is imported, so the scripts never touch food_app.db.
+# Import it before app or models:
+#
+#   import throwaway
+#   from app import app
+_tmp_dir = tempfile.mkdtemp(prefix="dishfinder_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp_dir, 'scratch.db')}"
+
+from app import app, prepare_database
+from models import db, User, Dish, Review
+from search import ensure_search_index
+
+
+def seed(num_dishes, reviewers=5, rated=True, dish_fields=None):
+    """
+    Reset the database to `num_dishes` dishes and `reviewers` users, each
+    of whom reviews every dish when `rated`; `dish_fields(i)` returns extra
+    Dish columns for dish i. Returns the first user's id.
+    """
+    db.drop_all()
+    prepare_database()
+    ensure_search_index(rebuild=True)  # drop_all() leaves the FTS table
+    users = [User(username=f"user{i}", password_hash="x") for i in range(reviewers)]
+    db.session.add_all(users)
+    for i in range(num_dishes):
+        dish = Dish(
+            name=f"Dish {i}",
+            description="Chicken and rice",
+            **(dish_fields(i) if dish_fields else {"tags": ["Dinner", f"Tag{i % 3}"]}),
+        )
+        db.session.add(dish)
+        if not rated:
+            continue
+        db.session.flush()
+        for j, user in enumerate(users):
+            rating = 1 + (i + j) % 5
+            db.session.add(
+                Review(dish=dish, author=user, rating=rating, comment="Tasty")
+            )
+            dish.record_rating(rating)
+    db.session.commit()
+    return users[0].id
+
+
+def logged_in_client(user_id):
+    """A test client with `user_id` logged in"""
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["_user_id"] = str(user_id)
+        session["_fresh"] = True
+    return client
@@ -0,0 +1,75 @@
+from flask_login import UserMixin
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from cache import Cache, MemoryBackend
+from models import db, User
+
+# Flask-Login user cache
+#
+# load_user runs on every authenticated request. Instead of an attached User
+# instance it returns a UserSnapshot: a plain copy of the few fields requests
+# read, cached per process for USER_CACHE_TTL seconds. Any committed update
+# or delete of a user (password or username change) drops its snapshot, so
+# the TTL only bounds staleness for writes made by other processes.
+
+
+class UserSnapshot(UserMixin):
+    """Detached, read-only copy of the User fields requests need"""
+
+    def __init__(self, user):
+        self.id = user.id
+        self.username = user.username
+        self.created_at = user.created_at
+
+    def __repr__(self):
+        return f"<UserSnapshot {self.username}>"
+
+
+class UserCache:
+    def __init__(self, ttl=60, max_entries=10000):
+        self.entries = Cache(
+            MemoryBackend(max_entries=max_entries), default_ttl=ttl, name="users"
+        )
+        event.listen(User, "after_update", self._user_changed)
+        event.listen(User, "after_delete", self._user_changed)
+        event.listen(Session, "after_commit", self._invalidate_committed)
+        event.listen(Session, "after_soft_rollback", self._discard_changes)
+
+    def init_app(self, app):
+        self.entries.default_ttl = app.config.get(
+            "USER_CACHE_TTL", self.entries.default_ttl
+        )
+        app.extensions["user_cache"] = self
+
+    def load(self, user_id):
+        """UserSnapshot for a session's user id, or None if there is no such user"""
+        try:
+            user_id = int(user_id)
+        except (TypeError, ValueError):
+            return None
+        snapshot = self.entries.get(user_id)
+        if snapshot is None:
+            user = db.session.get(User, user_id)
+            if user is None:
+                return None
+            snapshot = UserSnapshot(user)
+            self.entries.set(user_id, snapshot)
+        return snapshot
+
+    def invalidate(self, user_id):
+        self.entries.delete(int(user_id))
+
+    # Snapshots are dropped once the change is committed, so a concurrent
+    # request can't re-cache the old row between flush and commit
+    def _user_changed(self, mapper, connection, target):
+        session = object_session(target)
+        if session is not None:
+            session.info.setdefault("changed_user_ids", set()).add(target.id)
+
+    def _invalidate_committed(self, session):
+        for user_id in session.info.pop("changed_user_ids", ()):
+            self.invalidate(user_id)
+
+    def _discard_changes(self, session, previous_transaction):
+        session.info.pop("changed_user_ids", None)